@@ -11,9 +11,12 @@
 # or implied.
 
 from aiolimiter import AsyncLimiter
+import bisect
+import logging
 import threading
 import time
-from collections import deque
+
+logger = logging.getLogger(__name__)
 
 
 class RateLimiterManger:
@@ -43,7 +46,15 @@ class SyncRateLimiter:
         self.max_rate = max_rate
         self.time_period = time_period
         self.lock = threading.Lock()
-        self.call_timestamps = deque()
+        # Timestamps are appended in increasing order, so the list stays sorted
+        # and expired entries can be dropped with one bisect + slice deletion.
+        self.call_timestamps = []
+
+    def _drop_expired(self, now: float):
+        """Remove records outside the current time window with a single slice-del."""
+        cutoff = bisect.bisect_right(self.call_timestamps, now - self.time_period)
+        if cutoff:
+            del self.call_timestamps[:cutoff]
 
     def acquire(self):
         """
@@ -51,12 +62,7 @@ class SyncRateLimiter:
         """
         with self.lock:
             now = time.time()
-            # Remove records outside the current time window
-            while (
-                self.call_timestamps
-                and now - self.call_timestamps[0] >= self.time_period
-            ):
-                self.call_timestamps.popleft()
+            self._drop_expired(now)
 
             if len(self.call_timestamps) >= self.max_rate:
                 # Wait until the earliest request exits the window
@@ -65,11 +71,7 @@ class SyncRateLimiter:
                     time.sleep(sleep_time)
                     now = time.time()  # Update current time after waiting
                     # Clean up expired requests again
-                    while (
-                        self.call_timestamps
-                        and now - self.call_timestamps[0] >= self.time_period
-                    ):
-                        self.call_timestamps.popleft()
+                    self._drop_expired(now)
 
             # Append the timestamp of the current request
             self.call_timestamps.append(now)
@@ -98,3 +100,64 @@ class SyncRateLimiterManager:
 
 
 SYNC_RATE_LIMITER_MANAGER = SyncRateLimiterManager()
+
+
+class EndpointTokenBucket:
+    """
+    A token bucket shared by every model instance that talks to the same
+    endpoint, so embedder/reranker/query-encoder instances splitting one
+    server quota enforce the combined budget instead of each running at
+    max_rate independently.
+    """
+
+    _registry = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, max_rate: float, time_period: float = 1.0):
+        """
+        :param max_rate: The maximum number of requests allowed within the time window.
+        :param time_period: The length of the time window in seconds.
+        """
+        self.max_rate = max_rate
+        self.time_period = time_period
+        self._refill_rate = max_rate / time_period
+        self._tokens = float(max_rate)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key: str, max_rate: float, time_period: float = 1.0):
+        """
+        Get or create the shared bucket for an endpoint key (e.g. "base_url|api_key").
+        """
+        with cls._registry_lock:
+            bucket = cls._registry.get(key)
+            if bucket is None:
+                bucket = cls._registry[key] = cls(max_rate, time_period)
+            elif bucket.max_rate != max_rate or bucket.time_period != time_period:
+                # 已有桶的速率以首次创建为准，后来者的不同配置会被忽略，记录下来便于排查
+                logger.warning(
+                    f"EndpointTokenBucket key {key!r} already created with "
+                    f"max_rate={bucket.max_rate}/time_period={bucket.time_period}, "
+                    f"ignoring requested max_rate={max_rate}/time_period={time_period}"
+                )
+            return bucket
+
+    def acquire_token(self) -> float:
+        """
+        Take one token, returning the number of seconds the caller must wait
+        before proceeding (0 when a token was immediately available).
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.max_rate, self._tokens + (now - self._last_refill) * self._refill_rate
+            )
+            self._last_refill = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            wait_time = (1.0 - self._tokens) / self._refill_rate
+            self._tokens = 0.0
+            self._last_refill = now + wait_time
+            return wait_time
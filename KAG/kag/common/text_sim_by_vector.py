@@ -17,6 +17,23 @@ def cosine_similarity(vector1, vector2):
     return cosine
 
 
+def batch_cosine_similarity(query_vector, candidate_matrix):
+    """Computes cosine similarity between a query vector and each row of a matrix.
+
+    One BLAS matrix-vector product replaces the per-candidate Python loop of
+    dot/norm calls; rows with zero norm score 0.0.
+
+    :param query_vector: 1-D array of shape (D,)
+    :param candidate_matrix: 2-D array of shape (N, D)
+    :return: 1-D array of N cosine similarities
+    """
+    if query_vector.shape == (0,) or candidate_matrix.size == 0:
+        return np.zeros(len(candidate_matrix))
+    denom = np.linalg.norm(candidate_matrix, axis=1) * np.linalg.norm(query_vector)
+    denom[denom == 0] = 1.0
+    return (candidate_matrix @ query_vector) / denom
+
+
 def split_list(input_list, max_length=30):
     """
     Splits a list into multiple sublists where each sublist has a maximum length of max_length.
@@ -84,7 +101,7 @@ class TextSimilarity:
         if mention is None:
             return []
         mention_emb = self.sentence_encode(mention, is_cached)
-        if not mention_emb:
+        if mention_emb is None or len(mention_emb) == 0:
             return []
         candidates = [
             cand for cand in candidates if cand is not None and cand.strip() != ""
@@ -92,14 +109,24 @@ class TextSimilarity:
         if len(candidates) == 0:
             return []
         candidates_emb = self.sentence_encode(candidates)
-        candidates_dis = {}
-        for candidate, candidate_emb in zip(candidates, candidates_emb):
-            if not candidate_emb:
-                continue
-            cosine = cosine_similarity(np.array(mention_emb), np.array(candidate_emb))
-            if cosine < low_score:
-                continue
-            candidates_dis[candidate] = cosine
+        # stack the valid embeddings into one (N, D) matrix and score them in
+        # a single matmul instead of a dot/norm pair per candidate
+        valid = [
+            (candidate, candidate_emb)
+            for candidate, candidate_emb in zip(candidates, candidates_emb)
+            if candidate_emb is not None and len(candidate_emb) > 0
+        ]
+        if len(valid) == 0:
+            return []
+        candidate_matrix = np.asarray([emb for _, emb in valid], dtype=np.float32)
+        scores = batch_cosine_similarity(
+            np.asarray(mention_emb, dtype=np.float32), candidate_matrix
+        )
+        candidates_dis = {
+            candidate: float(score)
+            for (candidate, _), score in zip(valid, scores)
+            if score >= low_score
+        }
         candidates_dis = sorted(
             candidates_dis.items(), key=lambda x: x[-1], reverse=True
         )
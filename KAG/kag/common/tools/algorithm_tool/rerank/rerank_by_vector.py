@@ -4,7 +4,11 @@ from typing import List
 from kag.common.conf import KAG_CONFIG
 from kag.interface import ToolABC, VectorizeModelABC, RerankModelABC
 from kag.interface.solver.model.one_hop_graph import ChunkData
-from kag.common.text_sim_by_vector import TextSimilarity, cosine_similarity
+from kag.common.text_sim_by_vector import (
+    TextSimilarity,
+    batch_cosine_similarity,
+    cosine_similarity,
+)
 
 
 def _flat_passages_set(passages_set: List[List[ChunkData]]):
@@ -72,13 +76,27 @@ class RerankByVector(ToolABC):
         passages = [chunk.content for chunk in flat_chunks]
         passages_embs = self.text_sim.sentence_encode(passages, is_cached=True)
 
+        # passage embeddings are stacked once; each query then scores all
+        # passages with a single matmul instead of a Python loop of dot calls.
+        # Ragged embeddings (mixed dims / encode failures) fall back to the
+        # per-passage path.
+        try:
+            passages_matrix = np.asarray(passages_embs, dtype=np.float32)
+        except ValueError:
+            passages_matrix = None
+
         for query in queries:
             query_emb = self.text_sim.sentence_encode(query)
-            scores = [
-                cosine_similarity(np.array(query_emb), np.array(passage_emb))
-                for passage_emb in passages_embs
-            ]
-            sorted_idx = np.argsort(-np.array(scores))
+            if passages_matrix is not None:
+                scores = batch_cosine_similarity(
+                    np.asarray(query_emb, dtype=np.float32), passages_matrix
+                )
+            else:
+                scores = np.array([
+                    cosine_similarity(np.array(query_emb), np.array(passage_emb))
+                    for passage_emb in passages_embs
+                ])
+            sorted_idx = np.argsort(-scores)
             for rank, passage_id in enumerate(sorted_idx):
                 passage_scores[passage_id] += rank_scores[rank]
 
@@ -10,12 +10,19 @@
 # or implied.
 
 from typing import Union, Iterable
-from openai import OpenAI, AsyncOpenAI, AzureOpenAI, AsyncAzureOpenAI
 from kag.interface import VectorizeModelABC, EmbeddingVector
+from kag.common.rate_limiter import EndpointTokenBucket
 from typing import Callable
+import asyncio
+import functools
+import hashlib
+import json
 import logging
+import tempfile
 import time
-from collections import deque
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future
 from threading import Lock
 
 logger = logging.getLogger(__name__)
@@ -23,10 +30,284 @@ logger = logging.getLogger(__name__)
 # 最大token数限制（保守估计，中文1 token ≈ 1-2字符，设置400字符确保不超过512 tokens）
 MAX_TOKENS = 512
 MAX_CHARS = 400  # 保守估计，确保不超过512 tokens
+# 单次请求的token预算（服务端上限8191，留余量）
+MAX_TOKENS_PER_REQUEST = 8000
+
+
+class _EmbeddingCache:
+    """
+    进程内精确匹配LRU缓存：重复文本（RAG场景下常见的重复chunk、相同查询模板）
+    直接复用已有向量，完全省去网络往返和限流配额。
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def get(self, text: str):
+        """Return the cached embedding for text, or None on miss."""
+        k = self.key(text)
+        with self._lock:
+            embedding = self._data.get(k)
+            if embedding is not None:
+                self._data.move_to_end(k)
+            return embedding
+
+    def put(self, text: str, embedding) -> None:
+        k = self.key(text)
+        with self._lock:
+            self._data[k] = embedding
+            self._data.move_to_end(k)
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+
+class _BatchAggregator:
+    """
+    跨并发调用的微批聚合器：把短时间窗口内多个线程的单条文本
+    合并成一次 embeddings.create 批量请求，大幅减少 HTTP 请求数。
+    """
+
+    def __init__(self, flush_fn, max_batch_size: int = 64, max_wait_ms: float = 50):
+        """
+        Args:
+            flush_fn: Callable that takes a list of texts and returns a list of
+                embeddings (one per text, in order).
+            max_batch_size (int): Flush as soon as this many texts are pending.
+            max_wait_ms (float): Maximum time a caller waits for co-batching.
+        """
+        self._flush_fn = flush_fn
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait_ms / 1000.0
+        self._pending = deque()  # (text, Future) 待处理队列
+        self._cond = threading.Condition()
+        self._flusher = None
+
+    def submit(self, text: str) -> Future:
+        """Enqueue a single text; the returned future resolves to its embedding."""
+        future = Future()
+        with self._cond:
+            self._pending.append((text, future))
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="vectorize-batch-flusher", daemon=True
+                )
+                self._flusher.start()
+            self._cond.notify()
+        return future
+
+    def submit_many(self, texts) -> list:
+        """Enqueue multiple texts so they can share HTTP requests with other callers."""
+        return [self.submit(text) for text in texts]
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # 等待窗口期，凑满一批或超时后立即发送
+                deadline = time.monotonic() + self._max_wait
+                while len(self._pending) < self._max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = []
+                while self._pending and len(batch) < self._max_batch_size:
+                    batch.append(self._pending.popleft())
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self._flush_fn(texts)
+                for (_, future), embedding in zip(batch, embeddings):
+                    future.set_result(embedding)
+            except Exception as e:  # noqa: BLE001 - 异常转交给各 caller
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class _BatchedEmbeddingMixin:
+    """
+    OpenAI与Azure模型共用的嵌入实现：截断、token感知打包、精确匹配缓存、
+    限流错误判断与零向量兜底。单一实现避免两个模型的输入校验逻辑渐行渐远。
+    """
+
+    def _init_embedding_opts(
+        self,
+        model: str,
+        max_tokens: int = MAX_TOKENS,
+        max_chars: int = MAX_CHARS,
+        max_batch_size: int = 64,
+        max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
+    ):
+        """初始化共享的截断/打包/缓存状态，必须在子类__init__中调用"""
+        self.max_tokens = max_tokens
+        self.max_chars = max_chars
+        self.max_batch_size = max_batch_size
+        self.max_tokens_per_request = max_tokens_per_request
+        # tokenizer只初始化一次；非OpenAI官方模型回退到cl100k_base
+        self._enc = self._load_encoder(model)
+        # 重复文本（如相同chunk头）直接命中缓存，省去重复tokenize
+        self._truncate_long_text = functools.lru_cache(maxsize=4096)(
+            self._truncate_long_text_uncached
+        )
+        # 截断日志限流：大批量ingest时每1000次汇总打一条，而不是逐条warning
+        self._trunc_count = 0
+        self._trunc_logged = 0
+        # 兜底零向量按首次使用的维度缓存，所有失败返回共享同一对象
+        self._zero_vector = None
+        # 精确匹配缓存：实例按(base_url, model, api_key)单例，键用文本哈希即可
+        self._cache = _EmbeddingCache()
+
+    @staticmethod
+    def _load_encoder(model: str):
+        """加载并缓存tokenizer；tiktoken不可用或模型未注册时返回None（退回字符估算）"""
+        try:
+            import tiktoken
+        except ImportError:
+            return None
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+
+    def _count_tokens(self, text: str, budget_remaining: int = 0) -> int:
+        """
+        Count (or conservatively bound) the number of tokens in a text.
+
+        Args:
+            text: The text to measure.
+            budget_remaining: Remaining token budget of the current batch; when
+                the conservative char-based upper bound already fits, skip the
+                real encoding to avoid tokenizer overhead on short inputs.
+
+        Returns:
+            Token count, or a safe upper bound.
+        """
+        upper_bound = len(text) * 2  # 保守上界：中文1字符 ≈ 2 tokens
+        if self._enc is None or upper_bound <= budget_remaining:
+            return upper_bound
+        return len(self._enc.encode(text))
+
+    def _pack_batches(self, texts):
+        """
+        Greedily pack texts into sub-batches bounded by both max_batch_size
+        entries and max_tokens_per_request tokens, so large ingests never trip
+        the per-request server limits.
+
+        Yields:
+            Lists of texts, each safe to send as one embeddings request.
+        """
+        batch, batch_tokens = [], 0
+        for text in texts:
+            n = self._count_tokens(text, self.max_tokens_per_request - batch_tokens)
+            if batch and (
+                batch_tokens + n > self.max_tokens_per_request
+                or len(batch) >= self.max_batch_size
+            ):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += n
+        if batch:
+            yield batch
+
+    def _rate_limit(self):
+        """默认不做客户端限流（基类limiter已兜底）；需要令牌桶的子类覆写"""
+
+    def _truncate_text(self, text: str) -> str:
+        """
+        Truncate text to ensure it doesn't exceed the token limit.
+
+        Args:
+            text: The text to truncate.
+
+        Returns:
+            Truncated text; short inputs are returned unchanged (fast path).
+        """
+        if len(text) <= self.max_chars:
+            return text
+        return self._truncate_long_text(text)
+
+    def _truncate_long_text_uncached(self, text: str) -> str:
+        """按真实token数截断（字符截断对中文浪费、对英文过于保守）"""
+        if self._enc is None:
+            # 无tokenizer时退回字符截断
+            truncated = text[:self.max_chars - 3] + "..."
+        else:
+            tokens = self._enc.encode(text)
+            if len(tokens) <= self.max_tokens:
+                return text
+            truncated = self._enc.decode(tokens[: self.max_tokens - 1])
+        self._trunc_count += 1
+        if self._trunc_count - self._trunc_logged >= 1000 or self._trunc_logged == 0:
+            # %格式惰性求值：级别被过滤时不会构造字符串
+            logger.warning(
+                "Truncated %d texts so far (latest %d->%d chars) to meet token limit",
+                self._trunc_count,
+                len(text),
+                len(truncated),
+            )
+            self._trunc_logged = self._trunc_count
+        return truncated
+
+    def _embed_batches(self, texts):
+        """
+        Embed texts with cache partitioning and token-aware batch packing.
+
+        Args:
+            texts: Non-empty, already-truncated texts.
+
+        Returns:
+            List of embeddings, one per input text.
+        """
+        # 先查缓存，只对未命中的文本发起API调用
+        embeddings = [self._cache.get(text) for text in texts]
+        miss_indices = [i for i, e in enumerate(embeddings) if e is None]
+        if not miss_indices:
+            return embeddings
+
+        fetched = []
+        # 按条数和token预算切分子批，避免超出单请求上限
+        for batch in self._pack_batches([texts[i] for i in miss_indices]):
+            self._rate_limit()
+            results = self.client.embeddings.create(input=batch, model=self.model)
+            fetched.extend(item.embedding for item in results.data)
+        for i, embedding in zip(miss_indices, fetched):
+            self._cache.put(texts[i], embedding)
+            embeddings[i] = embedding
+        return embeddings
+
+    def _zero_vec(self, texts):
+        """
+        速率限制兜底：返回单个零向量（str输入）或零向量列表（list输入）。
+        所有返回值共享同一个列表，错误路径上零分配（调用方本就不应原地修改）。
+        """
+        dim = self.vector_dimensions or 1024
+        zero = self._zero_vector
+        if zero is None or len(zero) != dim:
+            zero = [0.0] * dim
+            self._zero_vector = zero
+        if isinstance(texts, str):
+            return zero
+        return [zero] * len(texts)
+
+    def _is_rate_limit_error(self, e: Exception) -> bool:
+        """按异常类型/状态码精确判断限流类错误，代替对str(e)的四次子串扫描"""
+        # 此时openai必已加载，这里只是sys.modules查表
+        from openai import APIStatusError, RateLimitError
+
+        if isinstance(e, RateLimitError):
+            return True
+        return isinstance(e, APIStatusError) and e.status_code in (403, 429)
 
 
 @VectorizeModelABC.register("openai")
-class OpenAIVectorizeModel(VectorizeModelABC):
+class OpenAIVectorizeModel(_BatchedEmbeddingMixin, VectorizeModelABC):
     """
     A class that extends the VectorizeModelABC base class.
     It invokes OpenAI or OpenAI-compatible embedding services to convert texts into embedding vectors.
@@ -43,6 +324,9 @@ class OpenAIVectorizeModel(VectorizeModelABC):
         time_period: float = 1,
         max_tokens: int = MAX_TOKENS,
         max_chars: int = MAX_CHARS,
+        max_batch_size: int = 64,
+        batch_wait_ms: float = 50,
+        max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
         **kwargs,
     ):
         """
@@ -57,68 +341,102 @@ class OpenAIVectorizeModel(VectorizeModelABC):
             max_chars (int, optional): Maximum characters per text (conservative estimate). Defaults to 400.
             max_rate (float, optional): Maximum requests per second. Defaults to 30 to avoid rate limiting.
             time_period (float, optional): Time window in seconds. Defaults to 1.
+            max_batch_size (int, optional): Maximum texts coalesced into one API request. Defaults to 64.
+            batch_wait_ms (float, optional): Window for coalescing concurrent single-text calls. Defaults to 50.
+            max_tokens_per_request (int, optional): Token budget per API request. Defaults to 8000.
         """
         api_key = api_key if api_key else "abc123"
         name = self.generate_key(base_url, model, api_key)
         super().__init__(name, vector_dimensions, max_rate, time_period)
         self.model = model
         self.timeout = timeout
-        self.max_tokens = max_tokens
-        self.max_chars = max_chars
+        self._init_embedding_opts(
+            model, max_tokens, max_chars, max_batch_size, max_tokens_per_request
+        )
+
+        # 惰性导入openai：注册路径只import本模块时不付SDK加载成本
+        from openai import OpenAI, AsyncOpenAI
+
         self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=self.timeout)
         self.aclient = AsyncOpenAI(
             api_key=api_key, base_url=base_url, timeout=self.timeout
         )
         
-        # 速率限制相关
+        # 速率限制相关：同一endpoint的所有实例共享一个令牌桶，合并执行总配额
         self.max_rate = max_rate
         self.time_period = time_period
-        self.request_times = deque()  # 记录请求时间
-        self.rate_limit_lock = Lock()
+        self._limiter_state = EndpointTokenBucket.get(
+            f"{base_url}|{api_key}", max_rate, time_period
+        )
+
+        # 微批聚合：多个并发 vectorize(str) 调用共享一次批量请求
+        self._aggregator = _BatchAggregator(
+            self._flush_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=batch_wait_ms,
+        )
 
     @classmethod
     def generate_key(cls, base_url, model, api_key, *args, **kwargs) -> str:
         return f"{cls}_{base_url}_{model}_{api_key}"
 
+    def _acquire_token(self) -> float:
+        """领取一个令牌，返回需要等待的秒数（0表示直接放行）"""
+        return self._limiter_state.acquire_token()
+
     def _rate_limit(self):
-        """实现速率限制"""
-        with self.rate_limit_lock:
-            now = time.time()
-            # 移除超出时间窗口的请求记录
-            while self.request_times and self.request_times[0] < now - self.time_period:
-                self.request_times.popleft()
-            
-            # 检查是否超过速率限制
-            if len(self.request_times) >= self.max_rate:
-                # 需要等待
-                wait_time = self.request_times[0] + self.time_period - now
-                if wait_time > 0:
-                    logger.debug(f"速率限制：等待 {wait_time:.2f} 秒")
-                    time.sleep(wait_time)
-                    # 重新计算
-                    now = time.time()
-                    while self.request_times and self.request_times[0] < now - self.time_period:
-                        self.request_times.popleft()
-            
-            # 记录本次请求时间
-            self.request_times.append(time.time())
-    
-    def _truncate_text(self, text: str) -> str:
+        """实现速率限制（令牌桶，time.monotonic 不受系统时间跳变影响）"""
+        wait_time = self._acquire_token()
+        if wait_time > 0:
+            logger.debug(f"速率限制：等待 {wait_time:.2f} 秒")
+            time.sleep(wait_time)
+
+    async def _arate_limit(self):
+        """异步速率限制：与同步路径共享同一令牌桶，等待时不阻塞事件循环"""
+        wait_time = self._acquire_token()
+        if wait_time > 0:
+            logger.debug(f"速率限制：等待 {wait_time:.2f} 秒")
+            await asyncio.sleep(wait_time)
+
+    def _flush_batch(self, texts):
         """
-        Truncate text to ensure it doesn't exceed max_chars limit.
-        
+        Issue batched embeddings requests for texts coalesced by the aggregator.
+
         Args:
-            text: The text to truncate.
-            
+            texts: Non-empty, already-truncated texts.
+
         Returns:
-            Truncated text.
+            List of embeddings, one per input text.
         """
-        if len(text) <= self.max_chars:
-            return text
-        # Truncate and add ellipsis
-        truncated = text[:self.max_chars - 3] + "..."
-        logger.warning(f"Text truncated from {len(text)} to {len(truncated)} characters to meet token limit")
-        return truncated
+        return self._embed_batches(texts)
+
+    def _vectorize_one(self, text: str) -> EmbeddingVector:
+        """
+        Fast path for a single text: no index maps, no result reconstruction.
+
+        Args:
+            text (str): The text to vectorize.
+
+        Returns:
+            EmbeddingVector: The embedding vector, or [] for an empty string.
+        """
+        # isspace()不像strip()那样拷贝字符串，空串判断零分配
+        if not text or text.isspace():
+            return []  # Return empty vector for empty string
+        try:
+            # 单条文本进入聚合队列，与其他并发调用合并为一次批量请求
+            return self._aggregator.submit(self._truncate_text(text)).result()
+        except Exception as e:
+            # 如果是速率限制错误，返回空向量避免后续错误
+            if self._is_rate_limit_error(e):
+                logger.warning("检测到速率限制错误，返回空向量")
+                return self._zero_vec(text)
+            logger.error(f"Error: {e}")
+            logger.error(f"input: {text}")
+            logger.error(f"model: {self.model}")
+            logger.error(f"timeout: {self.timeout}")
+            # 其他错误抛出异常
+            raise
 
     def vectorize(
         self, texts: Union[str, Iterable[str]]
@@ -132,68 +450,186 @@ class OpenAIVectorizeModel(VectorizeModelABC):
         Returns:
             Union[EmbeddingVector, Iterable[EmbeddingVector]]: The embedding vector(s) of the text(s).
         """
-        # 应用速率限制
-        self._rate_limit()
+        # 单条文本走专用快路径，跳过列表分支的映射/重建开销
+        # （type而非isinstance：热路径上更快，str子类仍落入下方isinstance分支）
+        if type(texts) is str:
+            return self._vectorize_one(texts)
 
         try:
             # Handle empty strings in the input
             if isinstance(texts, list):
-                # Create a map of original indices to track empty strings
-                empty_indices = {i: text.strip() == "" for i, text in enumerate(texts)}
-                # Filter out empty strings and truncate texts
-                filtered_texts = [
-                    self._truncate_text(text) if not empty_indices[i] else ""
-                    for i, text in enumerate(texts)
-                ]
-                # Remove empty strings for the API call
-                filtered_texts = [text for text in filtered_texts if text.strip() != ""]
-
-                if not filtered_texts:
-                    return [[] for _ in texts]  # Return empty vectors for all inputs
-
-                results = self.client.embeddings.create(
-                    input=filtered_texts, model=self.model
-                )
-
-                # Reconstruct the results with empty lists for empty strings
-                embeddings = [item.embedding for item in results.data]
-                full_results = []
-                embedding_idx = 0
-
-                for i in range(len(texts)):
-                    if empty_indices[i]:
-                        full_results.append([])  # Empty embedding for empty string
-                    else:
-                        full_results.append(embeddings[embedding_idx])
-                        embedding_idx += 1
+                # 单次遍历：记录非空下标并同时构建API输入，替代三次扫描和索引字典
+                keep_indices = []
+                api_input = []
+                for i, text in enumerate(texts):
+                    if text and not text.isspace():
+                        api_input.append(self._truncate_text(text))
+                        keep_indices.append(i)
+
+                # 预分配结果列表，空串位置共享同一个空向量
+                full_results = [[]] * len(texts)
+                if not api_input:
+                    return full_results  # Return empty vectors for all inputs
+
+                # 走聚合器队列，让并发 caller 的文本共享批量请求
+                futures = self._aggregator.submit_many(api_input)
+                for i, future in zip(keep_indices, futures):
+                    full_results[i] = future.result()
 
                 return full_results
-            elif isinstance(texts, str) and not texts.strip():
+            elif isinstance(texts, str) and (not texts or texts.isspace()):
                 return []  # Return empty vector for empty string
             else:
                 truncated_text = self._truncate_text(texts)
-                results = self.client.embeddings.create(input=truncated_text, model=self.model)
-                results = [item.embedding for item in results.data]
-                assert len(results) == 1
-                return results[0]
+                # 单条文本进入聚合队列，与其他并发调用合并为一次批量请求
+                return self._aggregator.submit(truncated_text).result()
         except Exception as e:
-            error_msg = str(e)
+            # 如果是速率限制错误，返回空向量避免后续错误
+            if self._is_rate_limit_error(e):
+                logger.warning("检测到速率限制错误，返回空向量")
+                return self._zero_vec(texts)
             logger.error(f"Error: {e}")
             logger.error(f"input: {texts}")
             logger.error(f"model: {self.model}")
             logger.error(f"timeout: {self.timeout}")
-            
-            # 如果是速率限制错误，返回空向量避免后续错误
-            if "403" in error_msg or "429" in error_msg or "rate limit" in error_msg.lower() or "rpm limit" in error_msg.lower():
-                logger.warning("检测到速率限制错误，返回空向量")
-                if isinstance(texts, str):
-                    return [0.0] * (self.vector_dimensions or 1024)
-                else:
-                    return [[0.0] * (self.vector_dimensions or 1024) for _ in texts]
-            
             # 其他错误抛出异常
             raise
 
+    async def _avectorize_many(
+        self, texts: Iterable[str], concurrency: int = 8
+    ) -> Iterable[EmbeddingVector]:
+        """
+        Vectorizes texts by dispatching token-packed sub-batches concurrently.
+
+        Args:
+            texts (Iterable[str]): Non-empty, already-truncated texts.
+            concurrency (int): Maximum in-flight API requests.
+
+        Returns:
+            Iterable[EmbeddingVector]: Ordered embeddings, one per input text.
+        """
+        texts = list(texts)
+        # 先查缓存，只对未命中的文本发起API调用
+        embeddings = [self._cache.get(text) for text in texts]
+        miss_indices = [i for i, e in enumerate(embeddings) if e is None]
+        if not miss_indices:
+            return embeddings
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(batch):
+            async with semaphore:
+                async with self.limiter:
+                    results = await self.aclient.embeddings.create(
+                        input=batch, model=self.model
+                    )
+            return [item.embedding for item in results.data]
+
+        parts = await asyncio.gather(
+            *(one(batch) for batch in self._pack_batches([texts[i] for i in miss_indices]))
+        )
+        fetched = [embedding for part in parts for embedding in part]
+        for i, embedding in zip(miss_indices, fetched):
+            self._cache.put(texts[i], embedding)
+            embeddings[i] = embedding
+        return embeddings
+
+    def vectorize_many(
+        self, texts: Iterable[str], concurrency: int = 8
+    ) -> Iterable[EmbeddingVector]:
+        """
+        Vectorizes a large batch of texts with concurrent sub-batch requests.
+
+        Unlike the sequential flush in vectorize, sub-batches run in parallel
+        (bounded by concurrency and the async limiter), which scales near
+        linearly on network-bound ingest until the rate limit saturates.
+
+        Args:
+            texts (Iterable[str]): The texts to vectorize.
+            concurrency (int, optional): Maximum in-flight API requests. Defaults to 8.
+
+        Returns:
+            Iterable[EmbeddingVector]: Ordered embeddings, one per input text.
+        """
+        texts = [
+            self._truncate_text(text) if text and not text.isspace() else "none"
+            for text in texts
+        ]
+        return asyncio.run(self._avectorize_many(texts, concurrency))
+
+    def vectorize_batch_api(
+        self, texts: Iterable[str], poll_interval: float = 30, timeout: float = 86400
+    ) -> Iterable[EmbeddingVector]:
+        """
+        Vectorizes texts through the server-side Batch API.
+
+        For latency-tolerant bulk indexing this is half the cost of the
+        synchronous endpoint and comes with far higher rate limits; the
+        trade-off is asynchronous completion (up to 24h window).
+
+        Args:
+            texts (Iterable[str]): The texts to vectorize.
+            poll_interval (float, optional): Seconds between status polls. Defaults to 30.
+            timeout (float, optional): Maximum seconds to wait for completion. Defaults to 86400.
+
+        Returns:
+            Iterable[EmbeddingVector]: Ordered embeddings, one per input text.
+
+        Raises:
+            TimeoutError: If the batch does not finish within timeout.
+            RuntimeError: If the batch finishes in a non-completed status.
+        """
+        texts = list(texts)
+        lines = []
+        for i, text in enumerate(texts):
+            body = {
+                "model": self.model,
+                "input": self._truncate_text(text) if text and not text.isspace() else "none",
+            }
+            lines.append(
+                json.dumps(
+                    {
+                        "custom_id": f"r{i}",
+                        "method": "POST",
+                        "url": "/v1/embeddings",
+                        "body": body,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+
+        with tempfile.NamedTemporaryFile("w+b", suffix=".jsonl") as f:
+            f.write("\n".join(lines).encode("utf-8"))
+            f.flush()
+            f.seek(0)
+            file_id = self.client.files.create(file=f, purpose="batch").id
+
+        batch = self.client.batches.create(
+            input_file_id=file_id,
+            endpoint="/v1/embeddings",
+            completion_window="24h",
+        )
+
+        deadline = time.monotonic() + timeout
+        while batch.status not in ("completed", "failed", "cancelled", "expired"):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"batch {batch.id} 在 {timeout} 秒内未完成")
+            time.sleep(poll_interval)
+            batch = self.client.batches.retrieve(batch.id)
+        if batch.status != "completed":
+            raise RuntimeError(f"batch {batch.id} 以状态 {batch.status} 结束")
+
+        # 按custom_id还原原始顺序
+        by_index = {}
+        output = self.client.files.content(batch.output_file_id)
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            index = int(record["custom_id"][1:])
+            by_index[index] = record["response"]["body"]["data"][0]["embedding"]
+        return [by_index.get(i, self._zero_vec("")) for i in range(len(texts))]
+
     async def avectorize(
         self, texts: Union[str, Iterable[str]]
     ) -> Union[EmbeddingVector, Iterable[EmbeddingVector]]:
@@ -206,41 +642,55 @@ class OpenAIVectorizeModel(VectorizeModelABC):
         Returns:
             Union[EmbeddingVector, Iterable[EmbeddingVector]]: The embedding vector(s) of the text(s).
         """
-        # 应用速率限制
-        self._rate_limit()
-        
-        async with self.limiter:
-            # Truncate texts to ensure they don't exceed token limit
+        # Truncate texts to ensure they don't exceed token limit
+        if isinstance(texts, list):
+            texts = [
+                self._truncate_text(text) if text and not text.isspace() else "none"
+                for text in texts
+            ]
+        elif isinstance(texts, str):
+            texts = self._truncate_text(texts) if texts and not texts.isspace() else "none"
+        try:
             if isinstance(texts, list):
-                texts = [
-                    self._truncate_text(text) if text.strip() != "" else "none"
-                    for text in texts
-                ]
-            elif isinstance(texts, str):
-                texts = self._truncate_text(texts) if texts.strip() != "" else "none"
-            try:
-                results = await self.aclient.embeddings.create(
-                    input=texts, model=self.model
-                )
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Error: {e}")
-                logger.error(f"input: {texts}")
-                logger.error(f"model: {self.model}")
-                logger.error(f"timeout: {self.timeout}")
-                
-                # 如果是速率限制错误，返回空向量
-                if "403" in error_msg or "429" in error_msg or "rate limit" in error_msg.lower() or "rpm limit" in error_msg.lower():
-                    logger.warning("检测到速率限制错误，返回空向量")
-                    if isinstance(texts, str):
-                        return [0.0] * (self.vector_dimensions or 1024)
-                    else:
-                        return [[0.0] * (self.vector_dimensions or 1024) for _ in texts]
-                
-                raise
+                # 先查缓存，只对未命中的文本发起API调用
+                embeddings = [self._cache.get(text) for text in texts]
+                miss_indices = [i for i, e in enumerate(embeddings) if e is None]
+                fetched = []
+                # 按条数和token预算切分子批，避免超出单请求上限
+                for batch in self._pack_batches([texts[i] for i in miss_indices]):
+                    # 异步限流：与同步路径共享令牌桶，每个子批请求各取一次令牌，
+                    # 等待用asyncio.sleep，不阻塞事件循环
+                    await self._arate_limit()
+                    results = await self.aclient.embeddings.create(
+                        input=batch, model=self.model
+                    )
+                    fetched.extend(item.embedding for item in results.data)
+                for i, embedding in zip(miss_indices, fetched):
+                    self._cache.put(texts[i], embedding)
+                    embeddings[i] = embedding
+                assert len(embeddings) == len(texts)
+                return embeddings
+            cached = self._cache.get(texts)
+            if cached is not None:
+                return cached
+            await self._arate_limit()
+            results = await self.aclient.embeddings.create(
+                input=texts, model=self.model
+            )
+        except Exception as e:
+            # 如果是速率限制错误，返回空向量
+            if self._is_rate_limit_error(e):
+                logger.warning("检测到速率限制错误，返回空向量")
+                return self._zero_vec(texts)
+            logger.error(f"Error: {e}")
+            logger.error(f"input: {texts}")
+            logger.error(f"model: {self.model}")
+            logger.error(f"timeout: {self.timeout}")
+            raise
         results = [item.embedding for item in results.data]
         if isinstance(texts, str):
             assert len(results) == 1
+            self._cache.put(texts, results[0])
             return results[0]
         else:
             assert len(results) == len(texts)
@@ -248,7 +698,7 @@ class OpenAIVectorizeModel(VectorizeModelABC):
 
 
 @VectorizeModelABC.register("azure_openai")
-class AzureOpenAIVectorizeModel(VectorizeModelABC):
+class AzureOpenAIVectorizeModel(_BatchedEmbeddingMixin, VectorizeModelABC):
     """A class that extends the VectorizeModelABC base class.
     It invokes Azure OpenAI or Azure OpenAI-compatible embedding services to convert texts into embedding vectors.
     """
@@ -266,6 +716,10 @@ class AzureOpenAIVectorizeModel(VectorizeModelABC):
         azure_ad_token_provider: Callable = None,
         max_rate: float = 1000,
         time_period: float = 1,
+        max_tokens: int = MAX_TOKENS,
+        max_chars: int = MAX_CHARS,
+        max_batch_size: int = 16,
+        max_tokens_per_request: int = MAX_TOKENS_PER_REQUEST,
     ):
         """
         Initializes the AzureOpenAIVectorizeModel instance.
@@ -280,11 +734,21 @@ class AzureOpenAIVectorizeModel(VectorizeModelABC):
             azure_ad_token_provider: A function that returns an Azure Active Directory token, will be invoked on every request.
             azure_deployment: A model deployment, if given sets the base client URL to include `/deployments/{azure_deployment}`.
                 Note: this means you won't be able to use non-deployment endpoints. Not supported with Assistants APIs.
+            max_tokens (int, optional): Maximum tokens per text. Defaults to 512.
+            max_chars (int, optional): Maximum characters per text (conservative estimate). Defaults to 400.
+            max_batch_size (int, optional): Maximum texts per API request. Defaults to 16 (Azure per-request input cap).
+            max_tokens_per_request (int, optional): Token budget per API request. Defaults to 8000.
         """
         name = self.generate_key(api_key, base_url, model)
         super().__init__(name, vector_dimensions, max_rate, time_period)
         self.model = model
         self.timeout = timeout
+        self._init_embedding_opts(
+            model, max_tokens, max_chars, max_batch_size, max_tokens_per_request
+        )
+        # 惰性导入openai：注册路径只import本模块时不付SDK加载成本
+        from openai import AzureOpenAI, AsyncAzureOpenAI
+
         self.client = AzureOpenAI(
             api_key=api_key,
             base_url=base_url,
@@ -322,14 +786,17 @@ class AzureOpenAIVectorizeModel(VectorizeModelABC):
         Returns:
             Union[EmbeddingVector, Iterable[EmbeddingVector]]: The embedding vector(s) of the text(s).
         """
-        results = self.client.embeddings.create(input=texts, model=self.model)
-        results = [item.embedding for item in results.data]
         if isinstance(texts, str):
-            assert len(results) == 1
-            return results[0]
-        else:
-            assert len(results) == len(texts)
-            return results
+            if not texts or texts.isspace():
+                return []  # Return empty vector for empty string
+            return self._embed_batches([self._truncate_text(texts)])[0]
+        texts = [
+            self._truncate_text(text) if text and not text.isspace() else "none"
+            for text in texts
+        ]
+        results = self._embed_batches(texts)
+        assert len(results) == len(texts)
+        return results
 
     async def avectorize(
         self, texts: Union[str, Iterable[str]]
@@ -343,23 +810,39 @@ class AzureOpenAIVectorizeModel(VectorizeModelABC):
         Returns:
             Union[EmbeddingVector, Iterable[EmbeddingVector]]: The embedding vector(s) of the text(s).
         """
-        async with self.limiter:
-            results = await self.aclient.embeddings.create(
-                input=texts, model=self.model
-            )
-        results = [item.embedding for item in results.data]
         if isinstance(texts, str):
-            assert len(results) == 1
-            return results[0]
-        else:
-            assert len(results) == len(texts)
-            return results
-
-
-if __name__ == "__main__":
-    vectorize_model = OpenAIVectorizeModel(
-        model="bge-m3", base_url="http://localhost:11434/v1"
-    )
-    texts = ["Hello, world!", "Hello, world!", "Hello, world!"]
-    embeddings = vectorize_model.vectorize("texts")
-    print(embeddings)
+            if not texts or texts.isspace():
+                return []  # Return empty vector for empty string
+            text = self._truncate_text(texts)
+            cached = self._cache.get(text)
+            if cached is not None:
+                return cached
+            async with self.limiter:
+                results = await self.aclient.embeddings.create(
+                    input=text, model=self.model
+                )
+            assert len(results.data) == 1
+            embedding = results.data[0].embedding
+            self._cache.put(text, embedding)
+            return embedding
+
+        texts = [
+            self._truncate_text(text) if text and not text.isspace() else "none"
+            for text in texts
+        ]
+        # 先查缓存，只对未命中的文本发起API调用
+        embeddings = [self._cache.get(text) for text in texts]
+        miss_indices = [i for i, e in enumerate(embeddings) if e is None]
+        fetched = []
+        # 按条数和token预算切分子批，避免超出单请求上限（Azure为16条/请求）
+        for batch in self._pack_batches([texts[i] for i in miss_indices]):
+            async with self.limiter:
+                results = await self.aclient.embeddings.create(
+                    input=batch, model=self.model
+                )
+            fetched.extend(item.embedding for item in results.data)
+        for i, embedding in zip(miss_indices, fetched):
+            self._cache.put(texts[i], embedding)
+            embeddings[i] = embedding
+        assert len(embeddings) == len(texts)
+        return embeddings
@@ -2,12 +2,12 @@
 带限流的Embedding模型包装器
 只对在线API进行速率限制，避免超限
 """
+import asyncio
 import time
 import logging
 from typing import Union, Iterable
-from collections import deque
-from threading import Lock
 from kag.interface import VectorizeModelABC, EmbeddingVector
+from kag.common.rate_limiter import EndpointTokenBucket
 
 logger = logging.getLogger(__name__)
 
@@ -43,38 +43,56 @@ class RateLimitedVectorizeModel(VectorizeModelABC):
         
         # 初始化被包装的模型
         self.wrapped_model = VectorizeModelABC.from_config(model)
+        # 一次性解析异步入口，避免每次调用hasattr
+        self._wrapped_avectorize = getattr(self.wrapped_model, "avectorize", None)
         
-        # 限流相关
+        # 限流相关：按endpoint共享令牌桶，与直连同一服务的其他实例合并执行总配额。
+        # 本地模型（bge/mock等）没有base_url/api_key，退化为实例私有桶，
+        # 避免所有无endpoint的模型挤进同一个"|"桶互相抢配额
+        base_url = model.get("base_url", "")
+        api_key = model.get("api_key", "")
+        if base_url or api_key:
+            bucket_key = f"{base_url}|{api_key}"
+        else:
+            bucket_key = f"{name}|{id(self)}"
         self.max_rate = max_rate
         self.time_period = time_period
-        self.request_times = deque()  # 记录请求时间
-        self.lock = Lock()
+        self._limiter_state = EndpointTokenBucket.get(
+            bucket_key,
+            max_rate,
+            time_period,
+        )
         
+        # 预分配兜底零向量，错误路径上复用同一对象，避免O(N*D)的分配风暴
+        self._zero_vector = [0.0] * vector_dimensions
+
         logger.info(f"RateLimitedVectorizeModel初始化: 模型={model_type}, 限流={max_rate}/秒")
-    
+
+    def _zero_vec(self, texts):
+        """返回共享的零向量（str输入）或零向量列表（list输入），调用方不应原地修改"""
+        if isinstance(texts, str):
+            return self._zero_vector
+        return [self._zero_vector] * len(texts)
+
+    def _acquire_token(self) -> float:
+        """领取一个令牌，返回需要等待的秒数（0表示直接放行）"""
+        return self._limiter_state.acquire_token()
+
     def _rate_limit(self):
-        """实现速率限制"""
-        with self.lock:
-            now = time.time()
-            # 移除超出时间窗口的请求记录
-            while self.request_times and self.request_times[0] < now - self.time_period:
-                self.request_times.popleft()
-            
-            # 检查是否超过速率限制
-            if len(self.request_times) >= self.max_rate:
-                # 需要等待
-                wait_time = self.request_times[0] + self.time_period - now
-                if wait_time > 0:
-                    logger.debug(f"速率限制：等待 {wait_time:.2f} 秒")
-                    time.sleep(wait_time)
-                    # 重新计算
-                    now = time.time()
-                    while self.request_times and self.request_times[0] < now - self.time_period:
-                        self.request_times.popleft()
-            
-            # 记录本次请求时间
-            self.request_times.append(time.time())
-    
+        """实现速率限制（令牌桶，time.monotonic 不受系统时间跳变影响）"""
+        wait_time = self._acquire_token()
+        if wait_time > 0:
+            logger.debug(f"速率限制：等待 {wait_time:.2f} 秒")
+            time.sleep(wait_time)
+
+    async def _arate_limit(self):
+        """异步速率限制：与同步路径共享同一令牌桶，等待时不阻塞事件循环"""
+        wait_time = self._acquire_token()
+        if wait_time > 0:
+            logger.debug(f"速率限制：等待 {wait_time:.2f} 秒")
+            await asyncio.sleep(wait_time)
+
+
     def vectorize(
         self, texts: Union[str, Iterable[str]]
     ) -> Union[EmbeddingVector, Iterable[EmbeddingVector]]:
@@ -97,10 +115,7 @@ class RateLimitedVectorizeModel(VectorizeModelABC):
             # 如果返回None，返回空向量避免后续错误
             if result is None:
                 logger.warning("模型返回None，返回空向量")
-                if isinstance(texts, str):
-                    return [0.0] * self.vector_dimensions
-                else:
-                    return [[0.0] * self.vector_dimensions for _ in texts]
+                return self._zero_vec(texts)
             
             return result
             
@@ -111,17 +126,11 @@ class RateLimitedVectorizeModel(VectorizeModelABC):
             # 如果是速率限制错误，返回空向量
             if "403" in error_msg or "429" in error_msg or "rate limit" in error_msg.lower() or "rpm limit" in error_msg.lower():
                 logger.warning("检测到速率限制错误，返回空向量")
-                if isinstance(texts, str):
-                    return [0.0] * self.vector_dimensions
-                else:
-                    return [[0.0] * self.vector_dimensions for _ in texts]
+                return self._zero_vec(texts)
             
             # 其他错误也返回空向量，避免崩溃
             logger.warning(f"模型调用失败，返回空向量: {error_msg[:100]}")
-            if isinstance(texts, str):
-                return [0.0] * self.vector_dimensions
-            else:
-                return [[0.0] * self.vector_dimensions for _ in texts]
+            return self._zero_vec(texts)
     
     async def avectorize(
         self, texts: Union[str, Iterable[str]]
@@ -129,20 +138,18 @@ class RateLimitedVectorizeModel(VectorizeModelABC):
         """
         异步向量化文本，带限流
         """
-        # 应用速率限制
-        self._rate_limit()
+        # 异步限流：与同步路径共享令牌桶，等待用asyncio.sleep，不阻塞事件循环
+        await self._arate_limit()
         
         try:
-            if hasattr(self.wrapped_model, 'avectorize'):
-                result = await self.wrapped_model.avectorize(texts)
+            if self._wrapped_avectorize is not None:
+                result = await self._wrapped_avectorize(texts)
             else:
-                result = self.wrapped_model.vectorize(texts)
+                # 同步模型丢到线程池执行，不阻塞事件循环
+                result = await asyncio.to_thread(self.wrapped_model.vectorize, texts)
             
             if result is None:
-                if isinstance(texts, str):
-                    return [0.0] * self.vector_dimensions
-                else:
-                    return [[0.0] * self.vector_dimensions for _ in texts]
+                return self._zero_vec(texts)
             
             return result
             
@@ -152,13 +159,7 @@ class RateLimitedVectorizeModel(VectorizeModelABC):
             
             if "403" in error_msg or "429" in error_msg or "rate limit" in error_msg.lower() or "rpm limit" in error_msg.lower():
                 logger.warning("检测到速率限制错误，返回空向量")
-                if isinstance(texts, str):
-                    return [0.0] * self.vector_dimensions
-                else:
-                    return [[0.0] * self.vector_dimensions for _ in texts]
+                return self._zero_vec(texts)
             
-            if isinstance(texts, str):
-                return [0.0] * self.vector_dimensions
-            else:
-                return [[0.0] * self.vector_dimensions for _ in texts]
+            return self._zero_vec(texts)
 
@@ -2,20 +2,130 @@
 KAG推理问答接口包装器
 用于外层系统调用KAG推理能力
 """
+import functools
+import hashlib
 import logging
+import mmap
+import os
 import sys
 import asyncio
 import json
 import shelve
+import threading
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from collections import OrderedDict, defaultdict, deque
+
+# orjson的C解码器比stdlib json快2-5倍且直接接受bytes；未安装时回退stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# nest_asyncio允许在已运行的事件循环上重入run_until_complete，
+# 同步query在异步上下文中可以就地执行而不必中转到后台循环线程
+try:
+    import nest_asyncio
+except ImportError:
+    nest_asyncio = None
 
 logger = logging.getLogger(__name__)
 
+# 格式化热路径（ID提取+实体/关系格式化）放在kg_format_fast模块中，
+# 带完整类型标注，可按需用mypyc/Cython预编译；这里导入的是编译产物
+# 或同目录的纯Python实现，行为完全一致
+try:
+    from .kg_format_fast import format_entity, format_relation, get_entity_id
+except ImportError:
+    # 脚本方式直接运行时没有包上下文，回退同目录导入
+    from kg_format_fast import format_entity, format_relation, get_entity_id
+
+
+@functools.lru_cache(maxsize=1)
+def _load_subgraph_class():
+    """解析一次SubGraph类并缓存，两个候选导入路径只尝试一遍"""
+    try:
+        from kag.interface.common.model.sub_graph import SubGraph
+        return SubGraph
+    except ImportError:
+        pass
+    try:
+        from kag.builder.model.sub_graph import SubGraph
+        return SubGraph
+    except ImportError:
+        logger.debug("无法导入SubGraph类，将使用字典方式解析")
+        return None
+
+# 边字段的候选key映射（camelCase与snake_case并存），展开热循环里的
+# 双重.get()回退为一次成员判断+一次取值
+_EDGE_KEY_MAP = (
+    ("from_id", ("from", "from_id")),
+    ("from_type", ("fromType", "from_type")),
+    ("label", ("label",)),
+    ("to_id", ("to", "to_id")),
+    ("to_type", ("toType", "to_type")),
+)
+
+
+def _fmt_edge(edge: Dict) -> Dict:
+    """按key映射表把一条原始边规整为统一字段名"""
+    formatted = {}
+    for field, alts in _EDGE_KEY_MAP:
+        for alt in alts:
+            if alt in edge:
+                formatted[field] = edge[alt]
+                break
+        else:
+            formatted[field] = ""
+    formatted["properties"] = edge.get("properties", {})
+    return formatted
+
+
+def _fmt_node(node: Dict, label_keys: tuple) -> Dict:
+    """规整一个原始节点；label_keys给出label字段的取值优先级"""
+    formatted = {
+        "id": node.get("id") or node.get("name", ""),
+        "label": next((node[k] for k in label_keys if k in node), ""),
+        "properties": node.get("properties", {})
+    }
+    if "name" in node:
+        formatted["properties"]["name"] = node["name"]
+    return formatted
+
+
+# 是否允许在已有事件循环中调用同步query（经由后台循环线程中转）。
+# 置为False后，异步上下文里必须改用await aquery()，不再默默付出线程中转开销
+SYNC_FROM_ASYNC_ALLOWED = True
+
 class KAGSolverWrapper:
     """KAG推理问答接口包装器"""
-    
+
+    # 常驻后台事件循环：同步query在已有事件循环中被调用时复用它，
+    # 避免每个问题都新建线程+事件循环再整体销毁
+    _bg_loop = None
+    _bg_thread = None
+    _bg_lock = threading.Lock()
+
+    # 问题答案LRU的容量上限
+    _QUERY_CACHE_MAX = 256
+
+    @classmethod
+    def _get_bg_loop(cls):
+        """懒创建常驻后台事件循环线程（进程级共享）"""
+        with cls._bg_lock:
+            if cls._bg_loop is None or not cls._bg_thread.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever,
+                    name="kag-solver-loop",
+                    daemon=True,
+                )
+                thread.start()
+                cls._bg_loop = loop
+                cls._bg_thread = thread
+            return cls._bg_loop
+
     def __init__(self, project_path: Optional[str] = None):
         """
         初始化KAG推理器
@@ -31,6 +141,23 @@ class KAGSolverWrapper:
         
         self._solver = None
         self._initialized = False
+
+        # get_kg_data结果缓存：checkpoint文件在两次查询之间很少变化，
+        # 用(路径, mtime_ns, 大小)指纹判断是否可以直接复用上次的解析结果
+        self._kg_cache = None
+        self._kg_cache_fp = None
+        self._kg_cache_lock = threading.Lock()
+        # SubGraph类在首次提取时解析一次后常驻
+        self._SubGraph = None
+
+        # DiskCache句柄池：每个目录的SQLite连接只打开一次，close()时统一释放
+        self._diskcache_pool = {}
+        self._diskcache_lock = threading.Lock()
+
+        # 问题答案的小LRU：agent循环里经常重复问同一个子问题，
+        # 命中时跳过整条LLM+图检索流水线（包装器里最大的单项开销）
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
     
     def _init_solver(self):
         """延迟初始化solver，避免导入错误"""
@@ -90,14 +217,65 @@ class KAGSolverWrapper:
             logger.error(f"KAG推理器初始化失败: {e}", exc_info=True)
             self._solver = None
             self._initialized = True  # 标记为已初始化，避免重复尝试
-    
-    def query(self, question: str) -> Dict:
+
+    @staticmethod
+    def _query_cache_key(question: str) -> str:
+        """问题文本的缓存key（blake2b比sha256快且无碰撞顾虑）"""
+        return hashlib.blake2b(question.encode("utf-8")).hexdigest()
+
+    def _query_cache_get(self, cache_key: str) -> Optional[Dict]:
+        """命中则移到LRU末尾并返回缓存的答案"""
+        with self._query_cache_lock:
+            cached = self._query_cache.get(cache_key)
+            if cached is not None:
+                self._query_cache.move_to_end(cache_key)
+            return cached
+
+    def _query_cache_put(self, cache_key: str, response: Dict):
+        """写入答案并按容量上限淘汰最久未用的条目"""
+        with self._query_cache_lock:
+            self._query_cache[cache_key] = response
+            self._query_cache.move_to_end(cache_key)
+            while len(self._query_cache) > self._QUERY_CACHE_MAX:
+                self._query_cache.popitem(last=False)
+
+    def clear_query_cache(self):
+        """清空问题答案缓存（知识库重建后应调用）"""
+        with self._query_cache_lock:
+            self._query_cache.clear()
+
+    @staticmethod
+    def _normalize_result(result: Any) -> Dict:
+        """把solver的返回值统一成{answer, references, raw_result}格式"""
+        # KAG的返回格式通常是字符串（答案）
+        if isinstance(result, str):
+            return {
+                "answer": result,
+                "references": [],
+                "raw_result": result
+            }
+        elif isinstance(result, dict):
+            return {
+                "answer": result.get("answer", str(result) if result else ""),
+                "references": result.get("references", []),
+                "raw_result": result
+            }
+        else:
+            return {
+                "answer": str(result) if result else "",
+                "references": [],
+                "raw_result": result
+            }
+
+
+    def query(self, question: str, force_sync: bool = False) -> Dict:
         """
         使用KAG推理引擎回答问题（同步版本）
-        
+
         Args:
             question: 用户问题
-            
+            force_sync: 在异步上下文中仍强制走同步线程中转（不推荐，应改用aquery）
+
         Returns:
             包含答案和引用的字典
         """
@@ -111,49 +289,48 @@ class KAGSolverWrapper:
                 "error": "KAG推理器未初始化"
             }
         
+        # 重复问题直接返回缓存答案，跳过整条solver流水线
+        cache_key = self._query_cache_key(question)
+        cached = self._query_cache_get(cache_key)
+        if cached is not None:
+            logger.debug("问题命中答案缓存，跳过solver调用")
+            return cached
+
         try:
             # 检查是否已经在事件循环中
             try:
                 loop = asyncio.get_running_loop()
-                # 如果已经在事件循环中，不能使用asyncio.run()
-                # 在新线程中运行异步代码
-                import concurrent.futures
-                
-                def run_in_thread():
-                    new_loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(new_loop)
-                    try:
-                        return new_loop.run_until_complete(self._solver.ainvoke(question))
-                    finally:
-                        new_loop.close()
-                
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(run_in_thread)
+                # 已在事件循环中：线程中转能工作但每次多付一次上下文切换，
+                # 绝大多数调用方都有aquery可用，提示迁移
+                if not (force_sync or SYNC_FROM_ASYNC_ALLOWED):
+                    raise TypeError(
+                        "在异步上下文中调用了同步query()，请改用 await aquery(...)"
+                    )
+                if not force_sync:
+                    logger.warning(
+                        "在异步上下文中调用了同步query()，建议改用 await aquery(...) "
+                        "以避免线程中转开销"
+                    )
+                if nest_asyncio is not None:
+                    # 给当前循环打重入补丁后就地执行，
+                    # 不需要第二个线程和第二个事件循环
+                    nest_asyncio.apply(loop)
+                    result = loop.run_until_complete(self._solver.ainvoke(question))
+                else:
+                    # 没有nest_asyncio时把协程投递到常驻后台循环执行，
+                    # 省掉每个问题一次线程+事件循环的创建和销毁
+                    future = asyncio.run_coroutine_threadsafe(
+                        self._solver.ainvoke(question), self._get_bg_loop()
+                    )
                     result = future.result(timeout=300)  # 5分钟超时
             except RuntimeError:
                 # 没有运行的事件循环，可以使用asyncio.run()
                 result = asyncio.run(self._solver.ainvoke(question))
-            
-            # 标准化返回格式
-            # KAG的返回格式通常是字符串（答案）
-            if isinstance(result, str):
-                return {
-                    "answer": result,
-                    "references": [],
-                    "raw_result": result
-                }
-            elif isinstance(result, dict):
-                return {
-                    "answer": result.get("answer", str(result) if result else ""),
-                    "references": result.get("references", []),
-                    "raw_result": result
-                }
-            else:
-                return {
-                    "answer": str(result) if result else "",
-                    "references": [],
-                    "raw_result": result
-                }
+
+            # 标准化返回格式并写入答案缓存（失败路径不缓存）
+            response = self._normalize_result(result)
+            self._query_cache_put(cache_key, response)
+            return response
         except Exception as e:
             logger.error(f"KAG推理查询失败: {e}", exc_info=True)
             return {
@@ -182,29 +359,21 @@ class KAGSolverWrapper:
                 "error": "KAG推理器未初始化"
             }
         
+        # 与同步版共用同一份答案缓存
+        cache_key = self._query_cache_key(question)
+        cached = self._query_cache_get(cache_key)
+        if cached is not None:
+            logger.debug("问题命中答案缓存，跳过solver调用")
+            return cached
+
         try:
             # 异步版本直接await
             result = await self._solver.ainvoke(question)
-            
-            # 标准化返回格式
-            if isinstance(result, str):
-                return {
-                    "answer": result,
-                    "references": [],
-                    "raw_result": result
-                }
-            elif isinstance(result, dict):
-                return {
-                    "answer": result.get("answer", str(result) if result else ""),
-                    "references": result.get("references", []),
-                    "raw_result": result
-                }
-            else:
-                return {
-                    "answer": str(result) if result else "",
-                    "references": [],
-                    "raw_result": result
-                }
+
+            # 标准化返回格式并写入答案缓存（失败路径不缓存）
+            response = self._normalize_result(result)
+            self._query_cache_put(cache_key, response)
+            return response
         except Exception as e:
             logger.error(f"KAG推理查询失败: {e}", exc_info=True)
             return {
@@ -253,56 +422,70 @@ class KAGSolverWrapper:
                     "relation_count": 0,
                     "error": f"Checkpoint目录不存在: {ckpt_dir}"
                 }
-            
-            # 提取实体和关系
-            result = self._extract_entities_and_relations(ckpt_dir)
-            
-            # 格式化数据
+
+            # 指纹未变化则直接返回缓存，跳过全部文件读取和解析
+            fingerprint = self._ckpt_fingerprint(ckpt_dir)
+            with self._kg_cache_lock:
+                if self._kg_cache is not None and fingerprint == self._kg_cache_fp:
+                    logger.debug("checkpoint未变化，复用缓存的知识图谱数据")
+                    return self._kg_cache
+
+            # 边提取边格式化：每条原始记录一到手就去重+格式化后丢弃，
+            # 不再拼成两份全量中间列表再整体重扫一遍（省一半峰值内存和一次全量遍历）
             formatted_entities = []
             formatted_relations = []
-            
-            raw_entities = result.get("entities", [])
-            raw_relations = result.get("relations", [])
-            logger.info(f"原始数据: {len(raw_entities)} 个实体, {len(raw_relations)} 个关系")
-            
-            # 去重实体（基于id）
-            entity_map = {}
-            skipped_entities = 0
-            for entity in raw_entities:
+            # 去重实体（基于id）：只需要成员判断，用set而不是再存一份dict值
+            seen_ids = set()
+            counters = {"raw_entities": 0, "raw_relations": 0,
+                        "skipped_entities": 0, "skipped_relations": 0}
+
+            def handle_entity(entity):
+                counters["raw_entities"] += 1
                 entity_id = self._get_entity_id(entity)
-                if entity_id and entity_id not in entity_map:
+                if entity_id and entity_id not in seen_ids:
                     formatted_entity = self._format_entity(entity)
                     if formatted_entity:
-                        entity_map[entity_id] = formatted_entity
+                        seen_ids.add(entity_id)
                         formatted_entities.append(formatted_entity)
                     else:
-                        skipped_entities += 1
+                        counters["skipped_entities"] += 1
                         logger.debug(f"跳过实体格式化失败: {type(entity)}, {str(entity)[:100]}")
                 elif not entity_id:
-                    skipped_entities += 1
+                    counters["skipped_entities"] += 1
                     logger.debug(f"跳过实体（无ID）: {type(entity)}, {str(entity)[:100]}")
-            
-            # 格式化关系
-            skipped_relations = 0
-            for relation in raw_relations:
+
+            def handle_relation(relation):
+                counters["raw_relations"] += 1
                 formatted_relation = self._format_relation(relation)
                 if formatted_relation:
                     formatted_relations.append(formatted_relation)
                 else:
-                    skipped_relations += 1
+                    counters["skipped_relations"] += 1
                     logger.debug(f"跳过关系格式化失败: {type(relation)}, {str(relation)[:100]}")
-            
+
+            self._extract_entities_and_relations(ckpt_dir, handle_entity, handle_relation)
+
+            logger.info(f"原始数据: {counters['raw_entities']} 个实体, {counters['raw_relations']} 个关系")
             logger.info(f"从checkpoint提取到 {len(formatted_entities)} 个实体, {len(formatted_relations)} 个关系")
-            if skipped_entities > 0 or skipped_relations > 0:
-                logger.warning(f"跳过了 {skipped_entities} 个实体, {skipped_relations} 个关系（格式化失败或无ID）")
-            
-            return {
-                "entities": formatted_entities,
-                "relations": formatted_relations,
+            if counters["skipped_entities"] > 0 or counters["skipped_relations"] > 0:
+                logger.warning(
+                    f"跳过了 {counters['skipped_entities']} 个实体, "
+                    f"{counters['skipped_relations']} 个关系（格式化失败或无ID）"
+                )
+
+            # 序列化边界：处理期间实体/关系都是__slots__轻量对象，
+            # 只在拼最终结果时一次性转回dict
+            kg_data = {
+                "entities": [e.to_dict() for e in formatted_entities],
+                "relations": [r.to_dict() for r in formatted_relations],
                 "entity_count": len(formatted_entities),
                 "relation_count": len(formatted_relations)
             }
-            
+            with self._kg_cache_lock:
+                self._kg_cache = kg_data
+                self._kg_cache_fp = fingerprint
+            return kg_data
+
         except Exception as e:
             logger.error(f"获取知识图谱数据失败: {e}", exc_info=True)
             return {
@@ -313,133 +496,189 @@ class KAGSolverWrapper:
                 "error": str(e)
             }
     
-    def _extract_entities_and_relations(self, ckpt_dir: Path) -> Dict[str, Any]:
-        """从checkpoint目录中提取所有实体和关系"""
-        all_entities = []
-        all_relations = []
-        
-        # 尝试导入SubGraph类
-        SubGraph = None
-        try:
-            from kag.interface.common.model.sub_graph import SubGraph as SG1
-            SubGraph = SG1
-        except ImportError:
-            try:
-                from kag.builder.model.sub_graph import SubGraph as SG2
-                SubGraph = SG2
-            except ImportError:
-                logger.debug("无法导入SubGraph类，将使用字典方式解析")
-        
-        # 1. 读取主checkpoint文件
+    def _ckpt_fingerprint(self, ckpt_dir: Path) -> tuple:
+        """计算checkpoint目录的内容指纹：所有文件的(路径, mtime_ns, 大小)"""
+        entries = []
+        for dirpath, _, filenames in os.walk(ckpt_dir):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                try:
+                    st = os.stat(full_path)
+                except OSError:
+                    continue
+                entries.append((full_path, st.st_mtime_ns, st.st_size))
+        entries.sort()
+        return tuple(entries)
+
+    def _extract_entities_and_relations(self, ckpt_dir: Path, on_node, on_edge) -> None:
+        """从checkpoint目录中提取所有实体和关系，逐条交给on_node/on_edge回调
+
+        回调在协调线程里调用（as_completed循环），调用方无需加锁。
+        """
+        node_count = edge_count = 0
+
+        # SubGraph类只解析一次（结果缓存在模块级lru_cache里）
+        SubGraph = self._SubGraph = _load_subgraph_class()
+
+        # 四个数据源位于互不相关的文件/目录，I/O为主，并发读取后
+        # 墙上时间≈最慢一个，而不是四者之和
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        tasks = []
         main_ckpt = ckpt_dir / "kag_checkpoint_0_1.ckpt"
         if main_ckpt.exists():
-            logger.debug(f"读取主checkpoint文件: {main_ckpt}")
-            main_data = self._read_txt_checkpoint(main_ckpt)
-            logger.debug(f"主checkpoint找到 {len(main_data)} 条记录")
-            for key, value in main_data.items():
-                if isinstance(value, (dict, list)) or (SubGraph and isinstance(value, SubGraph)):
-                    graph_data = self._parse_subgraph(value, SubGraph)
-                    if "nodes" in graph_data:
-                        all_entities.extend(graph_data["nodes"])
-                        logger.debug(f"从主checkpoint提取到 {len(graph_data['nodes'])} 个节点")
-                    if "edges" in graph_data:
-                        all_relations.extend(graph_data["edges"])
-                        logger.debug(f"从主checkpoint提取到 {len(graph_data['edges'])} 个边")
-        
-        # 2. 读取KAGPostProcessor的checkpoint（这里应该包含处理后的实体和关系）
-        postprocessor_dir = ckpt_dir / "KAGPostProcessor"
-        if postprocessor_dir.exists():
-            logger.debug(f"读取KAGPostProcessor checkpoint: {postprocessor_dir}")
-            cache_data = self._read_diskcache_checkpoint(postprocessor_dir)
-            logger.debug(f"KAGPostProcessor找到 {len(cache_data)} 条记录")
-            for key, value in cache_data.items():
-                graph_data = self._parse_subgraph(value, SubGraph)
+            tasks.append(("主checkpoint", self._load_main_checkpoint, main_ckpt, SubGraph))
+        for dir_name in ("KAGPostProcessor", "KnowledgeUnitSchemaFreeExtractor", "KGWriter"):
+            sub_dir = ckpt_dir / dir_name
+            if sub_dir.exists():
+                tasks.append((dir_name, self._load_cache_dir, sub_dir, SubGraph))
+
+        if tasks:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                futures = {
+                    executor.submit(fn, name, path, SubGraph): name
+                    for name, fn, path, SubGraph in tasks
+                }
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        nodes, edges = future.result()
+                    except Exception as e:
+                        logger.debug(f"读取 {name} checkpoint失败: {e}")
+                        continue
+                    node_count += len(nodes)
+                    edge_count += len(edges)
+                    # 每个数据源的批次用完即弃，不再累积成全量中间列表
+                    for node in nodes:
+                        on_node(node)
+                    for edge in edges:
+                        on_edge(edge)
+
+        logger.info(f"总共提取到 {node_count} 个实体, {edge_count} 个关系")
+
+    def _load_main_checkpoint(self, name: str, main_ckpt: Path, SubGraph) -> Tuple[list, list]:
+        """读取主checkpoint文件，返回(nodes, edges)"""
+        nodes, edges = [], []
+        logger.debug(f"读取主checkpoint文件: {main_ckpt}")
+        record_count = 0
+        for key, value in self._iter_txt_checkpoint(main_ckpt):
+            record_count += 1
+            # 已知是SubGraph就直接转换，跳过_parse_subgraph的整个类型判定阶梯
+            if SubGraph and isinstance(value, SubGraph):
+                sg_nodes, sg_edges = self._subgraph_to_lists(value)
+                nodes.extend(sg_nodes)
+                edges.extend(sg_edges)
+            elif isinstance(value, (dict, list)):
+                graph_data = self._parse_subgraph(value)
+                if "nodes" in graph_data:
+                    nodes.extend(graph_data["nodes"])
+                    logger.debug(f"从主checkpoint提取到 {len(graph_data['nodes'])} 个节点")
+                if "edges" in graph_data:
+                    edges.extend(graph_data["edges"])
+                    logger.debug(f"从主checkpoint提取到 {len(graph_data['edges'])} 个边")
+        logger.debug(f"主checkpoint找到 {record_count} 条记录")
+        return nodes, edges
+
+    def _load_cache_dir(self, name: str, cache_dir: Path, SubGraph) -> Tuple[list, list]:
+        """读取一个DiskCache格式的checkpoint目录，返回(nodes, edges)"""
+        all_nodes, all_edges = [], []
+        logger.debug(f"读取{name} checkpoint: {cache_dir}")
+        cache_data = self._read_diskcache_checkpoint(cache_dir)
+        logger.debug(f"{name}找到 {len(cache_data)} 条记录")
+        for key, value in cache_data.items():
+            # 同样：SubGraph走直达转换，其余类型才进入通用解析
+            if SubGraph and isinstance(value, SubGraph):
+                nodes, edges = self._subgraph_to_lists(value)
+            else:
+                graph_data = self._parse_subgraph(value)
                 nodes = graph_data.get("nodes", [])
                 edges = graph_data.get("edges", [])
-                if nodes:
-                    all_entities.extend(nodes)
-                    logger.debug(f"从KAGPostProcessor key {key[:50]}... 提取到 {len(nodes)} 个节点")
-                if edges:
-                    all_relations.extend(edges)
-                    logger.debug(f"从KAGPostProcessor key {key[:50]}... 提取到 {len(edges)} 个边")
-            
-            # 读取.val文件
-            for val_file in postprocessor_dir.rglob("*.val"):
+            if nodes:
+                all_nodes.extend(nodes)
+                logger.debug(f"从{name} key {key[:50]}... 提取到 {len(nodes)} 个节点")
+            if edges:
+                all_edges.extend(edges)
+                logger.debug(f"从{name} key {key[:50]}... 提取到 {len(edges)} 个边")
+
+        # diskcache读到数据时.val文件就是它刚返回的那批记录，再走一遍
+        # 只会重复计数；只有diskcache为空（如元数据库损坏）才扫游离.val兜底
+        if name == "KAGPostProcessor" and not cache_data:
+            for val_file in cache_dir.rglob("*.val"):
                 try:
                     import pickle
+                    # mmap让unpickler直接从页缓存取字节，省掉整文件读入
+                    # bytes的一次拷贝；protocol 5写出的大bytes字段可零拷贝
                     with open(val_file, "rb") as f:
-                        val_data = pickle.load(f)
-                        graph_data = self._parse_subgraph(val_data, SubGraph)
-                        if "nodes" in graph_data:
-                            all_entities.extend(graph_data["nodes"])
-                        if "edges" in graph_data:
-                            all_relations.extend(graph_data["edges"])
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        try:
+                            val_data = pickle.loads(mm)
+                        finally:
+                            mm.close()
+                        if SubGraph and isinstance(val_data, SubGraph):
+                            sg_nodes, sg_edges = self._subgraph_to_lists(val_data)
+                            all_nodes.extend(sg_nodes)
+                            all_edges.extend(sg_edges)
+                        else:
+                            graph_data = self._parse_subgraph(val_data)
+                            all_nodes.extend(graph_data.get("nodes", []))
+                            all_edges.extend(graph_data.get("edges", []))
                 except Exception as e:
                     logger.debug(f"读取 {val_file} 失败: {e}")
-        
-        # 3. 读取KnowledgeUnitSchemaFreeExtractor的checkpoint（这里包含原始提取的实体和关系）
-        extractor_dir = ckpt_dir / "KnowledgeUnitSchemaFreeExtractor"
-        if extractor_dir.exists():
-            logger.debug(f"读取KnowledgeUnitSchemaFreeExtractor checkpoint: {extractor_dir}")
-            cache_data = self._read_diskcache_checkpoint(extractor_dir)
-            logger.debug(f"KnowledgeUnitSchemaFreeExtractor找到 {len(cache_data)} 条记录")
-            for key, value in cache_data.items():
-                graph_data = self._parse_subgraph(value, SubGraph)
-                nodes = graph_data.get("nodes", [])
-                edges = graph_data.get("edges", [])
-                if nodes:
-                    all_entities.extend(nodes)
-                    logger.debug(f"从Extractor key {key[:50]}... 提取到 {len(nodes)} 个节点")
-                if edges:
-                    all_relations.extend(edges)
-                    logger.debug(f"从Extractor key {key[:50]}... 提取到 {len(edges)} 个边")
-        
-        # 4. 读取KGWriter的checkpoint（可能包含最终写入的实体和关系）
-        kgwriter_dir = ckpt_dir / "KGWriter"
-        if kgwriter_dir.exists():
-            logger.debug(f"读取KGWriter checkpoint: {kgwriter_dir}")
-            cache_data = self._read_diskcache_checkpoint(kgwriter_dir)
-            logger.debug(f"KGWriter找到 {len(cache_data)} 条记录")
-            for key, value in cache_data.items():
-                graph_data = self._parse_subgraph(value, SubGraph)
-                nodes = graph_data.get("nodes", [])
-                edges = graph_data.get("edges", [])
-                if nodes:
-                    all_entities.extend(nodes)
-                    logger.debug(f"从KGWriter key {key[:50]}... 提取到 {len(nodes)} 个节点")
-                if edges:
-                    all_relations.extend(edges)
-                    logger.debug(f"从KGWriter key {key[:50]}... 提取到 {len(edges)} 个边")
-        
-        logger.info(f"总共提取到 {len(all_entities)} 个实体, {len(all_relations)} 个关系")
-        
-        return {
-            "entities": all_entities,
-            "relations": all_relations
-        }
-    
-    def _read_txt_checkpoint(self, ckpt_path: Path) -> Dict[str, Any]:
-        """读取文本格式的checkpoint文件"""
-        data = {}
+
+        return all_nodes, all_edges
+
+    # 超过该大小的txt checkpoint改走mmap逐行切片，峰值内存只和单行有关
+    _LARGE_CKPT_BYTES = 256 << 20
+
+    def _iter_txt_checkpoint(self, ckpt_path: Path) -> Iterator[Tuple[str, Any]]:
+        """流式读取文本格式的checkpoint文件，逐条产出(id, value)对
+
+        以二进制大缓冲读取，orjson直接解码bytes（省一次utf-8 decode），
+        且不再物化整个文件的中间dict；超大文件用mmap按换行切片。
+        """
         if not ckpt_path.exists():
-            return data
-        
+            return
+
         try:
-            with open(ckpt_path, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
+            if ckpt_path.stat().st_size > self._LARGE_CKPT_BYTES:
+                with open(ckpt_path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
                     try:
-                        entry = json.loads(line)
-                        if "id" in entry and "value" in entry:
-                            data[entry["id"]] = entry["value"]
-                    except json.JSONDecodeError:
-                        continue
+                        pos = 0
+                        size = len(mm)
+                        while pos < size:
+                            newline = mm.find(b"\n", pos)
+                            if newline == -1:
+                                newline = size
+                            line = mm[pos:newline]
+                            pos = newline + 1
+                            entry = self._decode_ckpt_line(line)
+                            if entry is not None:
+                                yield entry["id"], entry["value"]
+                    finally:
+                        mm.close()
+                return
+
+            with open(ckpt_path, "rb", buffering=1 << 20) as f:
+                for line in f:
+                    entry = self._decode_ckpt_line(line)
+                    if entry is not None:
+                        yield entry["id"], entry["value"]
         except Exception as e:
             logger.debug(f"读取文本checkpoint失败 {ckpt_path}: {e}")
-        
-        return data
+
+    @staticmethod
+    def _decode_ckpt_line(line: bytes) -> Optional[Dict]:
+        """解码一行checkpoint记录，无效行返回None"""
+        if not line or line.isspace():
+            return None
+        try:
+            entry = _json_loads(line)
+        except ValueError:
+            return None
+        if "id" in entry and "value" in entry:
+            return entry
+        return None
     
     def _read_diskcache_checkpoint(self, cache_dir: Path) -> Dict[str, Any]:
         """读取DiskCache格式的checkpoint"""
@@ -448,307 +687,174 @@ class KAGSolverWrapper:
             return data
         
         try:
-            from diskcache import Cache
-            cache = Cache(str(cache_dir))
-            for key in cache:
-                try:
-                    value = cache[key]
-                    data[key] = value
-                except Exception as e:
-                    logger.debug(f"读取cache key {key} 失败: {e}")
-            cache.close()
+            cache = self._get_diskcache(cache_dir)
+            # 单事务内批量取值：一次提交代替每个key一次，且cache.get
+            # 不再回传我们用不到的expire/tag元数据。default用哨兵对象
+            # 区分"key不存在"和"存的值就是None"，后者也要保留
+            _missing = object()
+            with cache.transact():
+                for key in list(cache.iterkeys()):
+                    try:
+                        value = cache.get(key, default=_missing, retry=False)
+                    except Exception as e:
+                        logger.debug(f"读取cache key {key} 失败: {e}")
+                        continue
+                    if value is not _missing:
+                        data[key] = value
         except Exception as e:
             logger.debug(f"读取DiskCache失败 {cache_dir}: {e}")
         
         return data
-    
-    def _parse_subgraph(self, data: Any, SubGraph=None) -> Dict[str, Any]:
-        """解析SubGraph数据"""
-        # 如果是列表，可能是多个SubGraph或BuilderComponentData
-        if isinstance(data, list):
-            all_nodes = []
-            all_edges = []
-            for item in data:
-                # 先检查是否是SubGraph对象
-                if SubGraph and isinstance(item, SubGraph):
-                    parsed = self._parse_subgraph(item, SubGraph)  # 递归处理SubGraph对象
-                    if "nodes" in parsed:
-                        all_nodes.extend(parsed["nodes"])
-                    if "edges" in parsed:
-                        all_edges.extend(parsed["edges"])
-                elif isinstance(item, dict):
-                    if "resultEdges" in item:
-                        edges = item.get("resultEdges", [])
-                        for edge in edges:
-                            formatted_edge = {
-                                "from_id": edge.get("from", edge.get("from_id", "")),
-                                "from_type": edge.get("fromType", edge.get("from_type", "")),
-                                "label": edge.get("label", ""),
-                                "to_id": edge.get("to", edge.get("to_id", "")),
-                                "to_type": edge.get("toType", edge.get("to_type", "")),
-                                "properties": edge.get("properties", {})
-                            }
-                            all_edges.append(formatted_edge)
-                    if "resultNodes" in item:
-                        nodes = item.get("resultNodes", [])
-                        for node in nodes:
-                            formatted_node = {
-                                "id": node.get("id", node.get("name", "")),
-                                "label": node.get("type", node.get("label", "")),
-                                "properties": node.get("properties", {})
-                            }
-                            if "name" in node:
-                                formatted_node["properties"]["name"] = node["name"]
-                            if not formatted_node["id"]:
-                                formatted_node["id"] = node.get("name", "")
-                            all_nodes.append(formatted_node)
-                    if "nodes" in item:
-                        all_nodes.extend(item["nodes"])
-                    if "edges" in item:
-                        all_edges.extend(item["edges"])
-                else:
-                    # 递归解析其他类型
-                    parsed = self._parse_subgraph(item, SubGraph)
-                    if "nodes" in parsed:
-                        all_nodes.extend(parsed["nodes"])
-                    if "edges" in parsed:
-                        all_edges.extend(parsed["edges"])
-            return {"nodes": all_nodes, "edges": all_edges}
-        
-        if isinstance(data, dict):
-            if "nodes" in data or "edges" in data:
-                return data
-            if "resultEdges" in data or "resultNodes" in data:
-                return self._parse_subgraph([data], SubGraph)
-            if "data" in data:
-                return self._parse_subgraph(data["data"], SubGraph)
-            return data
-        elif SubGraph and isinstance(data, SubGraph):
-            # 如果是SubGraph对象，转换为字典
-            try:
-                result = data.to_dict()
-                # SubGraph.to_dict()返回的是resultNodes和resultEdges格式
-                nodes = []
-                edges = []
-                if "resultNodes" in result:
-                    for node in result["resultNodes"]:
-                        formatted_node = {
-                            "id": node.get("id", node.get("name", "")),
-                            "label": node.get("label", node.get("type", "")),
-                            "properties": node.get("properties", {})
-                        }
-                        if "name" in node:
-                            formatted_node["properties"]["name"] = node["name"]
-                        if not formatted_node["id"]:
-                            formatted_node["id"] = node.get("name", "")
-                        nodes.append(formatted_node)
-                elif "nodes" in result:
-                    nodes = result["nodes"]
-                else:
-                    # 尝试从对象属性获取
-                    node_objs = getattr(data, "nodes", [])
-                    for node in node_objs:
-                        if isinstance(node, dict):
-                            nodes.append(node)
-                        elif hasattr(node, "to_dict"):
-                            nodes.append(node.to_dict())
-                        else:
-                            nodes.append({
-                                "id": getattr(node, "id", ""),
-                                "label": getattr(node, "label", ""),
-                                "properties": getattr(node, "properties", {})
-                            })
-                
-                if "resultEdges" in result:
-                    for edge in result["resultEdges"]:
-                        formatted_edge = {
-                            "from_id": edge.get("from", edge.get("from_id", "")),
-                            "from_type": edge.get("fromType", edge.get("from_type", "")),
-                            "label": edge.get("label", ""),
-                            "to_id": edge.get("to", edge.get("to_id", "")),
-                            "to_type": edge.get("toType", edge.get("to_type", "")),
-                            "properties": edge.get("properties", {})
-                        }
-                        edges.append(formatted_edge)
-                elif "edges" in result:
-                    edges = result["edges"]
-                else:
-                    # 尝试从对象属性获取
-                    edge_objs = getattr(data, "edges", [])
-                    for edge in edge_objs:
-                        if isinstance(edge, dict):
-                            edges.append(edge)
-                        elif hasattr(edge, "to_dict"):
-                            edges.append(edge.to_dict())
-                        else:
-                            edges.append({
-                                "from_id": getattr(edge, "from_id", ""),
-                                "from_type": getattr(edge, "from_type", ""),
-                                "label": getattr(edge, "label", ""),
-                                "to_id": getattr(edge, "to_id", ""),
-                                "to_type": getattr(edge, "to_type", ""),
-                                "properties": getattr(edge, "properties", {})
-                            })
-                
-                return {"nodes": nodes, "edges": edges}
-            except Exception as e:
-                logger.debug(f"SubGraph.to_dict()失败: {e}")
-                return {
-                    "nodes": getattr(data, "nodes", []),
-                    "edges": getattr(data, "edges", [])
-                }
-        elif hasattr(data, "to_dict"):
-            # 如果有to_dict方法
-            try:
-                return data.to_dict()
-            except:
-                pass
-        elif hasattr(data, "__dict__"):
-            # 尝试从对象属性获取
-            attrs = data.__dict__
-            if "nodes" in attrs or "edges" in attrs:
-                return {
-                    "nodes": getattr(data, "nodes", []),
-                    "edges": getattr(data, "edges", [])
-                }
-            # 检查是否是BuilderComponentData包装
-            if "data" in attrs:
-                return self._parse_subgraph(attrs["data"], SubGraph)
-        
-        return {"nodes": [], "edges": []}
-    
-    def _get_entity_id(self, entity: Any) -> str:
-        """获取实体的唯一ID"""
-        if isinstance(entity, dict):
-            # 尝试多种方式获取ID
-            entity_id = (entity.get("id") or entity.get("name") or 
-                        entity.get("_id") or entity.get("identifier", ""))
-            # 如果还是没有，尝试从properties中获取
-            if not entity_id:
-                props = entity.get("properties", {})
-                entity_id = props.get("id") or props.get("name") or ""
-            return str(entity_id) if entity_id else ""
-        elif hasattr(entity, "id"):
-            return str(getattr(entity, "id", ""))
-        elif hasattr(entity, "name"):
-            return str(getattr(entity, "name", ""))
-        elif hasattr(entity, "__dict__"):
-            attrs = entity.__dict__
-            return str(attrs.get("id", attrs.get("name", "")))
-        return ""
-    
-    def _format_entity(self, entity: Any) -> Optional[Dict]:
-        """格式化实体数据"""
+
+    def _get_diskcache(self, cache_dir: Path):
+        """按目录复用DiskCache句柄，避免每次读取都重走SQLite建连"""
+        from diskcache import Cache
+        with self._diskcache_lock:
+            cache = self._diskcache_pool.get(cache_dir)
+            if cache is None:
+                # 用默认设置打开：非默认的disk_min_file_size会写进builder
+                # 侧cache的settings表，查看路径不应改动builder的磁盘状态
+                cache = Cache(str(cache_dir))
+                self._diskcache_pool[cache_dir] = cache
+            return cache
+
+    def close(self):
+        """释放持有的DiskCache句柄"""
+        with self._diskcache_lock:
+            for cache in self._diskcache_pool.values():
+                try:
+                    cache.close()
+                except Exception:
+                    pass
+            self._diskcache_pool.clear()
+
+    def __del__(self):
         try:
-            if isinstance(entity, dict):
-                # 尝试多种方式获取ID
-                entity_id = entity.get("id") or entity.get("name") or entity.get("_id") or ""
-                if not entity_id:
-                    # 如果还是没有，尝试从properties中获取
-                    props = entity.get("properties", {})
-                    entity_id = props.get("id") or props.get("name") or ""
-                
-                # 尝试多种方式获取类型
-                entity_type = entity.get("label") or entity.get("type") or entity.get("_type") or "Unknown"
-                
-                # 获取属性
-                properties = entity.get("properties", {})
-                if not properties and isinstance(entity, dict):
-                    # 如果properties为空，尝试从entity本身提取属性（排除特殊字段）
-                    exclude_keys = {"id", "name", "label", "type", "_id", "_type", "nodes", "edges"}
-                    properties = {k: v for k, v in entity.items() if k not in exclude_keys}
-                
-                # 获取名称
-                entity_name = properties.get("name") or entity.get("name") or entity_id
-                
-                # 确保properties中有name
-                if "name" not in properties:
-                    properties["name"] = entity_name
-                
-                # 确保ID不为空
-                if not entity_id:
-                    entity_id = entity_name or f"entity_{hash(str(entity))}"
-                
-                return {
-                    "id": str(entity_id),
-                    "name": str(entity_name),
-                    "type": str(entity_type),
-                    "properties": properties if isinstance(properties, dict) else {}
-                }
-            elif hasattr(entity, "to_dict"):
-                entity_dict = entity.to_dict()
-                return self._format_entity(entity_dict)
-            elif hasattr(entity, "__dict__"):
-                attrs = entity.__dict__
-                entity_id = str(attrs.get("id", attrs.get("name", "")))
-                entity_name = str(attrs.get("name", attrs.get("id", entity_id)))
-                entity_type = str(attrs.get("label", attrs.get("type", "Unknown")))
-                properties = dict(attrs.get("properties", {}))
-                if "name" not in properties:
-                    properties["name"] = entity_name
-                return {
-                    "id": entity_id,
-                    "name": entity_name,
-                    "type": entity_type,
-                    "properties": properties
-                }
-        except Exception as e:
-            logger.debug(f"格式化实体失败: {e}, entity类型: {type(entity)}")
-        
-        return None
+            self.close()
+        except Exception:
+            pass
     
-    def _format_relation(self, relation: Any) -> Optional[Dict]:
-        """格式化关系数据"""
+    def _parse_subgraph(self, data: Any) -> Dict[str, Any]:
+        """解析SubGraph数据（显式工作栈迭代，深层嵌套不再逐层递归）"""
+        SubGraph = self._SubGraph
+        all_nodes = []
+        all_edges = []
+        stack = deque([data])
+        while stack:
+            item = stack.pop()
+
+            # 列表：成员逐个入栈
+            if isinstance(item, list):
+                stack.extend(item)
+                continue
+
+            # SubGraph对象：直接转成节点/边列表
+            if SubGraph is not None and isinstance(item, SubGraph):
+                nodes, edges = self._subgraph_to_lists(item)
+                all_nodes.extend(nodes)
+                all_edges.extend(edges)
+                continue
+
+            if isinstance(item, dict):
+                handled = False
+                if "resultEdges" in item:
+                    handled = True
+                    for edge in item.get("resultEdges", []):
+                        all_edges.append(_fmt_edge(edge))
+                if "resultNodes" in item:
+                    handled = True
+                    for node in item.get("resultNodes", []):
+                        all_nodes.append(_fmt_node(node, ("type", "label")))
+                if "nodes" in item:
+                    handled = True
+                    all_nodes.extend(item["nodes"])
+                if "edges" in item:
+                    handled = True
+                    all_edges.extend(item["edges"])
+                # BuilderComponentData包装：继续展开内层data
+                if not handled and "data" in item:
+                    stack.append(item["data"])
+                continue
+
+            if hasattr(item, "to_dict"):
+                try:
+                    stack.append(item.to_dict())
+                    continue
+                except Exception:
+                    pass
+            if hasattr(item, "__dict__"):
+                attrs = item.__dict__
+                if "nodes" in attrs or "edges" in attrs:
+                    all_nodes.extend(getattr(item, "nodes", []) or [])
+                    all_edges.extend(getattr(item, "edges", []) or [])
+                elif "data" in attrs:
+                    stack.append(attrs["data"])
+
+        return {"nodes": all_nodes, "edges": all_edges}
+
+    def _subgraph_to_lists(self, data) -> Tuple[list, list]:
+        """把单个SubGraph对象转换为(节点列表, 边列表)"""
         try:
-            if isinstance(relation, dict):
-                # 尝试多种方式获取source和target
-                source = (relation.get("from_id") or relation.get("from") or 
-                         relation.get("source") or relation.get("_from") or "")
-                target = (relation.get("to_id") or relation.get("to") or 
-                         relation.get("target") or relation.get("_to") or "")
-                
-                # 如果source/target是对象，尝试提取ID
-                if isinstance(source, dict):
-                    source = source.get("id") or source.get("name") or ""
-                if isinstance(target, dict):
-                    target = target.get("id") or target.get("name") or ""
-                
-                relation_type = (relation.get("label") or relation.get("type") or 
-                               relation.get("_type") or "Unknown")
-                properties = relation.get("properties", {})
-                if not properties and isinstance(relation, dict):
-                    # 如果properties为空，尝试从relation本身提取属性
-                    exclude_keys = {"from_id", "from", "to_id", "to", "source", "target", 
-                                   "label", "type", "_from", "_to", "_type"}
-                    properties = {k: v for k, v in relation.items() if k not in exclude_keys}
-                
-                # 确保source和target都是字符串
-                source = str(source) if source else ""
-                target = str(target) if target else ""
-                
-                if source and target:
-                    return {
-                        "source": source,
-                        "target": target,
-                        "type": str(relation_type),
-                        "properties": properties if isinstance(properties, dict) else {}
-                    }
-            elif hasattr(relation, "to_dict"):
-                relation_dict = relation.to_dict()
-                return self._format_relation(relation_dict)
-            elif hasattr(relation, "__dict__"):
-                attrs = relation.__dict__
-                source = str(attrs.get("from_id", attrs.get("from", attrs.get("source", ""))))
-                target = str(attrs.get("to_id", attrs.get("to", attrs.get("target", ""))))
-                if source and target:
-                    return {
-                        "source": source,
-                        "target": target,
-                        "type": str(attrs.get("label", attrs.get("type", "Unknown"))),
-                        "properties": dict(attrs.get("properties", {}))
-                    }
+            result = data.to_dict()
+            # SubGraph.to_dict()返回的是resultNodes和resultEdges格式
+            nodes = []
+            edges = []
+            if "resultNodes" in result:
+                for node in result["resultNodes"]:
+                    nodes.append(_fmt_node(node, ("label", "type")))
+            elif "nodes" in result:
+                nodes = result["nodes"]
+            else:
+                # 尝试从对象属性获取
+                for node in getattr(data, "nodes", []):
+                    if isinstance(node, dict):
+                        nodes.append(node)
+                    elif hasattr(node, "to_dict"):
+                        nodes.append(node.to_dict())
+                    else:
+                        nodes.append({
+                            "id": getattr(node, "id", ""),
+                            "label": getattr(node, "label", ""),
+                            "properties": getattr(node, "properties", {})
+                        })
+
+            if "resultEdges" in result:
+                for edge in result["resultEdges"]:
+                    edges.append(_fmt_edge(edge))
+            elif "edges" in result:
+                edges = result["edges"]
+            else:
+                # 尝试从对象属性获取
+                for edge in getattr(data, "edges", []):
+                    if isinstance(edge, dict):
+                        edges.append(edge)
+                    elif hasattr(edge, "to_dict"):
+                        edges.append(edge.to_dict())
+                    else:
+                        edges.append({
+                            "from_id": getattr(edge, "from_id", ""),
+                            "from_type": getattr(edge, "from_type", ""),
+                            "label": getattr(edge, "label", ""),
+                            "to_id": getattr(edge, "to_id", ""),
+                            "to_type": getattr(edge, "to_type", ""),
+                            "properties": getattr(edge, "properties", {})
+                        })
+
+            return nodes, edges
         except Exception as e:
-            logger.debug(f"格式化关系失败: {e}, relation类型: {type(relation)}")
-        
-        return None
+            logger.debug(f"SubGraph.to_dict()失败: {e}")
+            return list(getattr(data, "nodes", []) or []), list(getattr(data, "edges", []) or [])
+
+
+    def _get_entity_id(self, entity: Any) -> str:
+        """获取实体的唯一ID（实现在kg_format_fast热路径模块）"""
+        return get_entity_id(entity)
+
+    def _format_entity(self, entity: Any):
+        """格式化实体数据，返回kg_format_fast.Entity（或None）"""
+        return format_entity(entity)
+
+    def _format_relation(self, relation: Any):
+        """格式化关系数据，返回kg_format_fast.Relation（或None）"""
+        return format_relation(relation)
 
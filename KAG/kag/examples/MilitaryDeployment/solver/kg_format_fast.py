@@ -0,0 +1,233 @@
+"""
+实体/关系格式化热路径
+
+get_kg_data的去重+格式化循环是纯Python的dict操作，属于典型的解释器
+瓶颈。把三个热函数独立成带完整类型标注的模块，可直接交给mypyc/Cython
+编译（mypycify(["kg_format_fast.py"])），未编译时按原速以纯Python运行。
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+# xxh64对兜底ID的repr字节做哈希比SipHash快一个量级；未安装时回退内置hash
+try:
+    from xxhash import xxh64_intdigest as _hash_bytes
+except ImportError:
+    def _hash_bytes(data: bytes) -> int:
+        return hash(data)
+
+logger = logging.getLogger(__name__)
+
+# 兜底ID哈希的输入上限：病态的大dict不应拖慢错误路径
+_FALLBACK_HASH_CAP = 4096
+
+
+def _fallback_entity_id(entity: Any) -> str:
+    """无ID实体的兜底ID：对截断的repr字节做xxh64，避免全量repr+SipHash"""
+    return f"entity_{_hash_bytes(repr(entity).encode()[:_FALLBACK_HASH_CAP])}"
+
+# 各字段的候选key表：按优先级取第一个非空值
+ID_KEYS: Tuple[str, ...] = ("id", "name", "_id", "identifier")
+TYPE_KEYS: Tuple[str, ...] = ("label", "type", "_type")
+SOURCE_KEYS: Tuple[str, ...] = ("from_id", "from", "source", "_from")
+TARGET_KEYS: Tuple[str, ...] = ("to_id", "to", "target", "_to")
+
+_ENTITY_EXCLUDE_KEYS = frozenset(
+    {"id", "name", "label", "type", "_id", "_type", "nodes", "edges"}
+)
+_RELATION_EXCLUDE_KEYS = frozenset(
+    {"from_id", "from", "to_id", "to", "source", "target",
+     "label", "type", "_from", "_to", "_type"}
+)
+
+
+class Entity:
+    """格式化后的实体记录
+
+    __slots__实例约72字节，4键dict至少232字节——百万级实体时RSS差3倍。
+    JSON序列化边界上用to_dict()转回dict。
+    """
+    __slots__ = ("id", "name", "type", "properties")
+
+    def __init__(self, id: str, name: str, type: str, properties: Dict[str, Any]):
+        self.id = id
+        self.name = name
+        self.type = type
+        self.properties = properties
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "type": self.type,
+            "properties": self.properties,
+        }
+
+
+class Relation:
+    """格式化后的关系记录，内存布局同Entity"""
+    __slots__ = ("source", "target", "type", "properties")
+
+    def __init__(self, source: str, target: str, type: str, properties: Dict[str, Any]):
+        self.source = source
+        self.target = target
+        self.type = type
+        self.properties = properties
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "target": self.target,
+            "type": self.type,
+            "properties": self.properties,
+        }
+
+
+def first_value(record: Dict[str, Any], keys: Tuple[str, ...]) -> Optional[Any]:
+    """按key表顺序返回第一个非空字段值，没有则返回None"""
+    for key in keys:
+        value = record.get(key)
+        if value:
+            return value
+    return None
+
+
+def get_entity_id(entity: Any) -> str:
+    """获取实体的唯一ID"""
+    # 绝大多数实体解码出来就是dict，优先走指针比较的快路径
+    if type(entity) is dict:
+        for key in ID_KEYS:
+            value = entity.get(key)
+            if value:
+                return str(value)
+        # 如果还是没有，尝试从properties中获取
+        props = entity.get("properties")
+        if props:
+            value = props.get("id") or props.get("name")
+            if value:
+                return str(value)
+        return ""
+    if isinstance(entity, dict):
+        # dict子类走同样的逻辑
+        entity_id = first_value(entity, ID_KEYS)
+        if not entity_id:
+            props = entity.get("properties", {})
+            entity_id = props.get("id") or props.get("name") or ""
+        return str(entity_id) if entity_id else ""
+    elif hasattr(entity, "id"):
+        return str(getattr(entity, "id", ""))
+    elif hasattr(entity, "name"):
+        return str(getattr(entity, "name", ""))
+    elif hasattr(entity, "__dict__"):
+        attrs = entity.__dict__
+        return str(attrs.get("id", attrs.get("name", "")))
+    return ""
+
+
+def format_entity(entity: Any) -> Optional[Entity]:
+    """格式化实体数据"""
+    try:
+        if isinstance(entity, dict):
+            # 按key表取ID
+            entity_id = first_value(entity, ID_KEYS) or ""
+            if not entity_id:
+                # 如果还是没有，尝试从properties中获取
+                props = entity.get("properties", {})
+                entity_id = props.get("id") or props.get("name") or ""
+
+            # 按key表取类型
+            entity_type = first_value(entity, TYPE_KEYS) or "Unknown"
+
+            # 获取属性
+            properties = entity.get("properties", {})
+            if not properties:
+                # 如果properties为空，尝试从entity本身提取属性（排除特殊字段）
+                properties = {
+                    k: v for k, v in entity.items()
+                    if k not in _ENTITY_EXCLUDE_KEYS
+                }
+
+            # 获取名称
+            entity_name = properties.get("name") or entity.get("name") or entity_id
+
+            # 确保properties中有name
+            if "name" not in properties:
+                properties["name"] = entity_name
+
+            # 确保ID不为空
+            if not entity_id:
+                entity_id = entity_name or _fallback_entity_id(entity)
+
+            return Entity(
+                str(entity_id),
+                str(entity_name),
+                str(entity_type),
+                properties if isinstance(properties, dict) else {},
+            )
+        elif hasattr(entity, "to_dict"):
+            return format_entity(entity.to_dict())
+        elif hasattr(entity, "__dict__"):
+            attrs = entity.__dict__
+            entity_id = str(attrs.get("id", attrs.get("name", "")))
+            entity_name = str(attrs.get("name", attrs.get("id", entity_id)))
+            entity_type = str(attrs.get("label", attrs.get("type", "Unknown")))
+            properties = dict(attrs.get("properties", {}))
+            if "name" not in properties:
+                properties["name"] = entity_name
+            return Entity(entity_id, entity_name, entity_type, properties)
+    except Exception as e:
+        logger.debug(f"格式化实体失败: {e}, entity类型: {type(entity)}")
+
+    return None
+
+
+def format_relation(relation: Any) -> Optional[Relation]:
+    """格式化关系数据"""
+    try:
+        if isinstance(relation, dict):
+            # 按key表取source和target
+            source = first_value(relation, SOURCE_KEYS) or ""
+            target = first_value(relation, TARGET_KEYS) or ""
+
+            # 如果source/target是对象，尝试提取ID
+            if isinstance(source, dict):
+                source = source.get("id") or source.get("name") or ""
+            if isinstance(target, dict):
+                target = target.get("id") or target.get("name") or ""
+
+            relation_type = first_value(relation, TYPE_KEYS) or "Unknown"
+            properties = relation.get("properties", {})
+            if not properties:
+                # 如果properties为空，尝试从relation本身提取属性
+                properties = {
+                    k: v for k, v in relation.items()
+                    if k not in _RELATION_EXCLUDE_KEYS
+                }
+
+            # 确保source和target都是字符串
+            source = str(source) if source else ""
+            target = str(target) if target else ""
+
+            if source and target:
+                return Relation(
+                    source,
+                    target,
+                    str(relation_type),
+                    properties if isinstance(properties, dict) else {},
+                )
+        elif hasattr(relation, "to_dict"):
+            return format_relation(relation.to_dict())
+        elif hasattr(relation, "__dict__"):
+            attrs = relation.__dict__
+            source = str(attrs.get("from_id", attrs.get("from", attrs.get("source", ""))))
+            target = str(attrs.get("to_id", attrs.get("to", attrs.get("target", ""))))
+            if source and target:
+                return Relation(
+                    source,
+                    target,
+                    str(attrs.get("label", attrs.get("type", "Unknown"))),
+                    dict(attrs.get("properties", {})),
+                )
+    except Exception as e:
+        logger.debug(f"格式化关系失败: {e}, relation类型: {type(relation)}")
+
+    return None
@@ -10,25 +10,70 @@
 # or implied.
 import asyncio
 import logging
-from kag.common.registry import import_modules_from_path
-from kag.interface import SolverPipelineABC
-from kag.common.conf import KAG_CONFIG
+import threading
 
 logger = logging.getLogger(__name__)
 
+# uvloop的C实现selector比stdlib快约2倍；未安装时沿用默认事件循环
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
+
+# 进程级单例：pipeline构建要经过配置解析、组件工厂分发和LLM客户端初始化，
+# 每个问题重建一遍纯属浪费；事件循环常驻后台线程，复用避免每次create+close
+_SOLVER = None
+_LOOP = None
+_LOOP_THREAD = None
+_INIT_LOCK = threading.Lock()
+
+
+def _get_solver():
+    """懒构建并缓存solver pipeline（双重检查锁）
+
+    kag的接口/配置模块会连带加载LLM客户端等重依赖，推迟到首次
+    查询时才导入，单纯import qa不再付出冷启动开销。
+    """
+    global _SOLVER
+    if _SOLVER is None:
+        with _INIT_LOCK:
+            if _SOLVER is None:
+                from kag.interface import SolverPipelineABC
+                from kag.common.conf import KAG_CONFIG
+
+                _SOLVER = SolverPipelineABC.from_config(
+                    KAG_CONFIG.all_config["kag_solver_pipeline"]
+                )
+    return _SOLVER
+
+
+def _get_loop():
+    """懒启动常驻事件循环线程，同步入口经由run_coroutine_threadsafe提交"""
+    global _LOOP, _LOOP_THREAD
+    if _LOOP is None or not _LOOP_THREAD.is_alive():
+        with _INIT_LOCK:
+            if _LOOP is None or not _LOOP_THREAD.is_alive():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever,
+                    name="kag-qa-loop",
+                    daemon=True,
+                )
+                thread.start()
+                _LOOP = loop
+                _LOOP_THREAD = thread
+    return _LOOP
+
+
+async def aquery(question: str):
+    """使用KAG推理引擎回答问题（异步版本）"""
+    solver = _get_solver()
+    result = await solver.ainvoke(question)
 
-def query(question: str):
-    """使用KAG推理引擎回答问题"""
-    solver = SolverPipelineABC.from_config(
-        KAG_CONFIG.all_config["kag_solver_pipeline"]
-    )
-    
-    # KAG的pipeline使用异步方法
-    result = asyncio.run(solver.ainvoke(question))
-    
     logger.info(f"\n问题: {question}")
     logger.info(f"答案: {result}")
-    
+
     # 标准化返回格式
     if isinstance(result, str):
         return {
@@ -44,7 +89,31 @@ def query(question: str):
         }
 
 
+async def _gather_all(questions):
+    return await asyncio.gather(*(aquery(q) for q in questions))
+
+
+def query(question: str):
+    """使用KAG推理引擎回答问题"""
+    return asyncio.run_coroutine_threadsafe(
+        aquery(question), _get_loop()
+    ).result()
+
+
+def query_batch(questions):
+    """并发回答一批问题
+
+    gather让N个问题的LLM/检索网络延迟相互重叠，
+    总耗时≈最慢一个而不是N次串行往返。
+    """
+    return asyncio.run_coroutine_threadsafe(
+        _gather_all(questions), _get_loop()
+    ).result()
+
+
 if __name__ == "__main__":
+    from kag.common.registry import import_modules_from_path
+
     import_modules_from_path(".")
     import sys
     
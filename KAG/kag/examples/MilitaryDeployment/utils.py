@@ -2,6 +2,7 @@
 MilitaryDeployment项目工具函数和Schema定义
 包含从旧系统迁移过来的工具函数和Schema定义
 """
+from types import MappingProxyType
 
 # ============ OpenSPG Schema定义 ============
 # 用于KAG知识图谱构建的Schema定义
@@ -83,7 +84,7 @@ constraintRefersTo(约束涉及): RelationType
 """
 
 # Entity类型定义（用于程序化访问）
-ENTITY_TYPES = {
+_RAW_ENTITY_TYPES = {
     "OperationalUnit": {
         "description": "作战单元",
         "properties": {
@@ -147,7 +148,7 @@ ENTITY_TYPES = {
 }
 
 # 关系类型定义
-RELATION_TYPES = {
+_RAW_RELATION_TYPES = {
     "hasCapability": {
         "description": "具备能力",
         "source_type": "OperationalUnit",
@@ -188,10 +189,30 @@ RELATION_TYPES = {
     },
 }
 
+# 对外暴露只读视图：Schema在进程生命周期内不变，冻结后既防止被调用方
+# 意外改写，也允许解释器走dict的C查找快路径
+ENTITY_TYPES = MappingProxyType(
+    {k: MappingProxyType(v) for k, v in _RAW_ENTITY_TYPES.items()}
+)
+RELATION_TYPES = MappingProxyType(
+    {k: MappingProxyType(v) for k, v in _RAW_RELATION_TYPES.items()}
+)
+
+# 导入时预计算的派生索引：标签全集和各类型的属性名集合，
+# 校验时用frozenset做O(1)成员判断，不再逐次扫描Schema字典
+KNOWN_ENTITY_LABELS = frozenset(ENTITY_TYPES)
+KNOWN_RELATION_LABELS = frozenset(RELATION_TYPES)
+ENTITY_PROPERTY_KEYS = MappingProxyType({
+    k: frozenset(v.get("properties", ())) for k, v in _RAW_ENTITY_TYPES.items()
+})
+RELATION_PROPERTY_KEYS = MappingProxyType({
+    k: frozenset(v.get("properties", ())) for k, v in _RAW_RELATION_TYPES.items()
+})
+
 # 注意：已不再区分collection，统一使用知识图谱
 # 以下定义仅用于向后兼容
-COLLECTION_TO_ENTITY_TYPE = {
+COLLECTION_TO_ENTITY_TYPE = MappingProxyType({
     "knowledge": "MilitaryUnit",
     "equipment": "Equipment"
-}
+})
 
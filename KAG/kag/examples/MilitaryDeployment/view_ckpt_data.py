@@ -1,13 +1,24 @@
 """
 查看KAG checkpoint中提取的实体和关系数据
 """
+import mmap
 import os
 import sys
 import json
-import shelve
 from pathlib import Path
-from typing import Dict, List, Any
-from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Tuple
+from collections import Counter, deque
+
+# orjson的C解析器比stdlib json快3-5倍且直接接受bytes；未安装时回退stdlib
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
 
 # 添加KAG路径
 BASE_DIR = Path(__file__).parent.parent.parent.parent.parent
@@ -29,36 +40,96 @@ except ImportError:
         SUBGRAPH_AVAILABLE = False
 
 
-def read_txt_checkpoint(ckpt_path: Path) -> Dict[str, Any]:
-    """读取文本格式的checkpoint文件"""
-    data = {}
+# 边字段的候选key映射（camelCase与snake_case并存），展开重整循环里的
+# 双重.get()回退为一次成员判断+一次取值
+_EDGE_KEY_MAP = (
+    ("from_id", ("from", "from_id")),
+    ("from_type", ("fromType", "from_type")),
+    ("label", ("label",)),
+    ("to_id", ("to", "to_id")),
+    ("to_type", ("toType", "to_type")),
+)
+
+
+# 类型/标签的词汇表很小（几种实体和关系类型重复出现在几万条记录上），
+# intern之后全库共享同一批字符串对象，Counter和dict的哈希/相等退化为指针比较
+_intern = sys.intern
+
+
+def _fmt_edge(edge: Dict) -> Dict:
+    """按key映射表把一条原始边规整为统一字段名"""
+    formatted = {}
+    for field, alts in _EDGE_KEY_MAP:
+        for alt in alts:
+            if alt in edge:
+                formatted[field] = edge[alt]
+                break
+        else:
+            formatted[field] = ""
+    for field in ("from_type", "label", "to_type"):
+        value = formatted[field]
+        if type(value) is str:
+            formatted[field] = _intern(value)
+    formatted["properties"] = edge.get("properties", {})
+    return formatted
+
+
+def _fmt_node(node: Dict, label_keys: tuple) -> Dict:
+    """规整一个原始节点；label_keys给出label字段的取值优先级"""
+    label = next((node[k] for k in label_keys if k in node), "")
+    formatted = {
+        "id": node.get("id") or node.get("name", ""),
+        "label": _intern(label) if type(label) is str else label,
+        "properties": node.get("properties", {})
+    }
+    if "name" in node:
+        formatted["properties"]["name"] = node["name"]
+    return formatted
+
+
+def iter_txt_checkpoint(ckpt_path: Path) -> Iterator[Tuple[str, Any]]:
+    """流式读取文本格式的checkpoint文件，逐条产出(id, value)
+
+    调用方只做单趟遍历，生成器省掉整个中间dict（哈希表+N个表项）；
+    大checkpoint下常驻内存减半。
+    """
     if not ckpt_path.exists():
-        return data
-    
+        return
+
     try:
-        with open(ckpt_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    entry = json.loads(line)
+        # mmap整文件后用readline逐行取切片，免去逐行read()的系统调用，
+        # 也不像mm[:]那样把整个文件复制成一个bytes对象；行直接交给orjson解码
+        with open(ckpt_path, "rb") as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                return  # 空文件
+            try:
+                for raw in iter(mm.readline, b""):
+                    raw = raw.strip()
+                    if not raw:
+                        continue
+                    try:
+                        entry = _json_loads(raw)
+                    except ValueError:
+                        continue
                     if "id" in entry and "value" in entry:
-                        data[entry["id"]] = entry["value"]
-                except json.JSONDecodeError:
-                    continue
+                        yield entry["id"], entry["value"]
+            finally:
+                mm.close()
     except Exception as e:
         print(f"读取文本checkpoint失败 {ckpt_path}: {e}")
-    
-    return data
 
 
 def read_bin_checkpoint(ckpt_path: Path) -> Dict[str, Any]:
     """读取二进制格式的checkpoint文件（shelve）"""
+    # shelve连带dbm后端，只有读二进制checkpoint才需要，函数内再导入
+    import shelve
+
     data = {}
     if not ckpt_path.exists():
         return data
-    
+
     try:
         # 尝试作为shelve文件读取
         with shelve.open(str(ckpt_path), "r") as db:
@@ -85,223 +156,350 @@ def read_diskcache_checkpoint(cache_dir: Path) -> Dict[str, Any]:
     try:
         from diskcache import Cache
         cache = Cache(str(cache_dir))
-        for key in cache:
+        try:
             try:
-                value = cache[key]
-                data[key] = value
-                # 调试：打印前几个key的类型
-                if len(data) <= 3:
-                    print(f"    Key: {key}, Type: {type(value)}, Value preview: {str(value)[:200]}")
+                # 单事务整表扫描：`for key in cache`后逐key点查每条要走
+                # 两次SQLite查询，这里一条SELECT取回全部行，再用DiskCache
+                # 自己的Disk解码器还原key和value
+                rows = cache._sql(
+                    "SELECT key, raw, mode, filename, value FROM Cache"
+                ).fetchall()
+                for db_key, raw, mode, filename, value in rows:
+                    try:
+                        key = cache._disk.get(db_key, raw)
+                        data[key] = cache._disk.fetch(mode, filename, value, False)
+                        # 调试：打印前几个key的类型
+                        if len(data) <= 3:
+                            print(f"    Key: {key}, Type: {type(data[key])}, Value preview: {str(data[key])[:200]}")
+                    except Exception as e:
+                        print(f"读取cache key {db_key} 失败: {e}")
             except Exception as e:
-                print(f"读取cache key {key} 失败: {e}")
-        cache.close()
+                # 整表扫描依赖DiskCache内部表结构，失败时回退逐key点查
+                print(f"    批量扫描失败（{e}），回退逐key读取")
+                for key in cache:
+                    try:
+                        value = cache[key]
+                        data[key] = value
+                        if len(data) <= 3:
+                            print(f"    Key: {key}, Type: {type(value)}, Value preview: {str(value)[:200]}")
+                    except Exception as e2:
+                        print(f"读取cache key {key} 失败: {e2}")
+        finally:
+            cache.close()
     except Exception as e:
         print(f"读取DiskCache失败 {cache_dir}: {e}")
     
     return data
 
 
-def parse_subgraph(data: Any) -> Dict[str, Any]:
-    """解析SubGraph数据"""
-    # 如果是列表，可能是多个SubGraph或BuilderComponentData
-    if isinstance(data, list):
-        all_nodes = []
-        all_edges = []
-        for item in data:
-            # 先检查是否是SubGraph对象
-            if SUBGRAPH_AVAILABLE and SubGraph and isinstance(item, SubGraph):
-                parsed = parse_subgraph(item)  # 递归处理SubGraph对象
-                if "nodes" in parsed:
-                    all_nodes.extend(parsed["nodes"])
-                if "edges" in parsed:
-                    all_edges.extend(parsed["edges"])
-            elif isinstance(item, dict):
-                # 检查是否是字典格式的SubGraph数据
-                # 检查是否有resultEdges（这是LLM返回的原始格式）
-                if "resultEdges" in item:
-                    # 转换LLM返回的格式到标准格式
-                    edges = item.get("resultEdges", [])
-                    for edge in edges:
-                        # 转换格式：from -> from_id, to -> to_id
-                        formatted_edge = {
-                            "from_id": edge.get("from", edge.get("from_id", "")),
-                            "from_type": edge.get("fromType", edge.get("from_type", "")),
-                            "label": edge.get("label", ""),
-                            "to_id": edge.get("to", edge.get("to_id", "")),
-                            "to_type": edge.get("toType", edge.get("to_type", "")),
-                            "properties": edge.get("properties", {})
-                        }
-                        all_edges.append(formatted_edge)
-                
-                # 检查是否有resultNodes
-                if "resultNodes" in item:
-                    nodes = item.get("resultNodes", [])
-                    for node in nodes:
-                        formatted_node = {
-                            "id": node.get("id", node.get("name", "")),
-                            "label": node.get("type", node.get("label", "")),
-                            "properties": node.get("properties", {})
-                        }
-                        if "name" in node:
-                            formatted_node["properties"]["name"] = node["name"]
-                        # 如果id为空，使用name作为id
-                        if not formatted_node["id"]:
-                            formatted_node["id"] = node.get("name", "")
-                        all_nodes.append(formatted_node)
-                
-                # 检查标准格式
-                if "nodes" in item:
-                    all_nodes.extend(item["nodes"])
-                if "edges" in item:
-                    all_edges.extend(item["edges"])
-            else:
-                # 递归解析其他类型
-                parsed = parse_subgraph(item)
-                if "nodes" in parsed:
-                    all_nodes.extend(parsed["nodes"])
-                if "edges" in parsed:
-                    all_edges.extend(parsed["edges"])
-        return {"nodes": all_nodes, "edges": all_edges}
-    
-    if isinstance(data, dict):
-        # 如果是字典，检查是否有nodes和edges
-        if "nodes" in data or "edges" in data:
-            return data
-        # 检查是否有resultEdges/resultNodes格式
-        if "resultEdges" in data or "resultNodes" in data:
-            return parse_subgraph([data])  # 转换为列表格式处理
-        # 可能是SubGraph的字典表示
-        if "data" in data:
-            return parse_subgraph(data["data"])
-        return data
-    elif SUBGRAPH_AVAILABLE and SubGraph and isinstance(data, SubGraph):
-        # 如果是SubGraph对象，转换为字典
+def parse_subgraph(data: Any, memo: Dict = None) -> Dict[str, Any]:
+    """解析SubGraph数据
+
+    memo是一次提取运行内按对象身份的备忘录：同一个value对象会从多个
+    checkpoint数据源到达这里，命中后不再重新遍历嵌套结构。memo里同时
+    持有输入对象的引用，保证id()在运行期间不会被复用。
+    """
+    if memo is not None:
+        memo_key = id(data)
+        hit = memo.get(memo_key)
+        if hit is not None and hit[0] is data:
+            return hit[1]
+
+    all_nodes = []
+    all_edges = []
+    # 显式工作栈代替逐层递归：深层嵌套的builder输出不再有每元素一次的
+    # 函数帧开销，也不会触发RecursionError
+    work = deque([data])
+    while work:
+        item = work.pop()
+
+        # 列表：成员逐个入栈（展平"list套list套SubGraph"的情况）
+        if isinstance(item, list):
+            work.extend(item)
+            continue
+
+        # SubGraph对象：恰好是SubGraph本身（绝大多数情况）时直接读
+        # nodes/edges属性，省掉to_dict()的中间resultNodes/resultEdges字典；
+        # 子类仍走通用的to_dict转换
+        if SUBGRAPH_AVAILABLE and SubGraph is not None:
+            if type(item) is SubGraph:
+                nodes, edges = _subgraph_attrs_to_lists(item)
+                all_nodes.extend(nodes)
+                all_edges.extend(edges)
+                continue
+            if isinstance(item, SubGraph):
+                nodes, edges = _subgraph_to_lists(item)
+                all_nodes.extend(nodes)
+                all_edges.extend(edges)
+                continue
+
+        if isinstance(item, dict):
+            handled = False
+            # resultEdges/resultNodes是LLM返回的原始格式，规整字段名
+            if "resultEdges" in item:
+                handled = True
+                for edge in item.get("resultEdges", []):
+                    all_edges.append(_fmt_edge(edge))
+            if "resultNodes" in item:
+                handled = True
+                for node in item.get("resultNodes", []):
+                    all_nodes.append(_fmt_node(node, ("type", "label")))
+            # 标准格式
+            if "nodes" in item:
+                handled = True
+                all_nodes.extend(item["nodes"])
+            if "edges" in item:
+                handled = True
+                all_edges.extend(item["edges"])
+            # BuilderComponentData包装：继续展开内层data
+            if not handled and "data" in item:
+                work.append(item["data"])
+            continue
+
+        if hasattr(item, "to_dict"):
+            try:
+                work.append(item.to_dict())
+                continue
+            except Exception:
+                pass
+        if hasattr(item, "__dict__"):
+            attrs = item.__dict__
+            if "nodes" in attrs or "edges" in attrs:
+                all_nodes.extend(getattr(item, "nodes", []) or [])
+                all_edges.extend(getattr(item, "edges", []) or [])
+            elif "data" in attrs:
+                work.append(attrs["data"])
+
+    result = {"nodes": all_nodes, "edges": all_edges}
+    if memo is not None:
+        memo[memo_key] = (data, result)
+    return result
+
+
+def _subgraph_attrs_to_lists(sg):
+    """直接从SubGraph的nodes/edges属性构建(节点列表, 边列表)
+
+    单趟遍历就地生成规整dict，不经过to_dict()的中间表示再重新拆分。
+    """
+    nodes = []
+    for node in sg.nodes or []:
+        properties = dict(getattr(node, "properties", None) or {})
+        name = getattr(node, "name", "")
+        if name and "name" not in properties:
+            properties["name"] = name
+        label = getattr(node, "label", "")
+        nodes.append({
+            "id": getattr(node, "id", "") or name,
+            "label": _intern(label) if type(label) is str else label,
+            "properties": properties
+        })
+
+    edges = []
+    for edge in sg.edges or []:
+        label = getattr(edge, "label", "")
+        from_type = getattr(edge, "from_type", "")
+        to_type = getattr(edge, "to_type", "")
+        edges.append({
+            "from_id": getattr(edge, "from_id", ""),
+            "from_type": _intern(from_type) if type(from_type) is str else from_type,
+            "label": _intern(label) if type(label) is str else label,
+            "to_id": getattr(edge, "to_id", ""),
+            "to_type": _intern(to_type) if type(to_type) is str else to_type,
+            "properties": getattr(edge, "properties", None) or {}
+        })
+
+    return nodes, edges
+
+
+def _subgraph_to_lists(data):
+    """把单个SubGraph对象转换为(节点列表, 边列表)"""
+    try:
+        result = data.to_dict()
+        # SubGraph.to_dict()返回的是resultNodes和resultEdges格式
+        nodes = []
+        edges = []
+        if "resultNodes" in result:
+            for node in result["resultNodes"]:
+                nodes.append(_fmt_node(node, ("label",)))
+        elif "nodes" in result:
+            nodes = result["nodes"]
+        else:
+            # 尝试从对象属性获取
+            for node in getattr(data, "nodes", []):
+                if isinstance(node, dict):
+                    nodes.append(node)
+                elif hasattr(node, "to_dict"):
+                    nodes.append(node.to_dict())
+                else:
+                    nodes.append({
+                        "id": getattr(node, "id", ""),
+                        "label": getattr(node, "label", ""),
+                        "properties": getattr(node, "properties", {})
+                    })
+
+        if "resultEdges" in result:
+            for edge in result["resultEdges"]:
+                edges.append(_fmt_edge(edge))
+        elif "edges" in result:
+            edges = result["edges"]
+        else:
+            # 尝试从对象属性获取
+            for edge in getattr(data, "edges", []):
+                if isinstance(edge, dict):
+                    edges.append(edge)
+                elif hasattr(edge, "to_dict"):
+                    edges.append(edge.to_dict())
+                else:
+                    edges.append({
+                        "from_id": getattr(edge, "from_id", ""),
+                        "from_type": getattr(edge, "from_type", ""),
+                        "label": getattr(edge, "label", ""),
+                        "to_id": getattr(edge, "to_id", ""),
+                        "to_type": getattr(edge, "to_type", ""),
+                        "properties": getattr(edge, "properties", {})
+                    })
+
+        return nodes, edges
+    except Exception as e:
+        print(f"      to_dict()失败: {e}")
+        return list(getattr(data, "nodes", []) or []), list(getattr(data, "edges", []) or [])
+
+
+def _load_and_parse(val_path: str):
+    """工作进程函数：反序列化一个.val文件并解析出(nodes, edges)"""
+    import pickle
+    try:
+        with open(val_path, "rb") as f:
+            val_data = pickle.load(f)
+    except Exception as e:
+        print(f"  读取 {val_path} 失败: {e}")
+        return [], []
+    graph_data = parse_subgraph(val_data)
+    return graph_data.get("nodes", []), graph_data.get("edges", [])
+
+
+def _label(item: Any) -> str:
+    """取节点/边的类型标签（intern后做Counter key），用于统计"""
+    if isinstance(item, dict):
+        label = item.get("label", "Unknown")
+    else:
+        label = getattr(item, "label", "Unknown")
+    return _intern(label) if type(label) is str else label
+
+
+# pandas的value_counts基于NumPy哈希表向量化计数，标签数十万级时
+# 明显快于逐元素循环；标签少于该阈值时DataFrame构建开销反而更大
+_VECTORIZE_MIN_ROWS = 100_000
+# numba首次调用要付约1秒的JIT编译，只有百万级标签时编译计数循环才划算
+_NUMBA_MIN_ROWS = 1_000_000
+_numba_bincount = None
+
+
+def _get_numba_bincount():
+    """懒编译numba版bincount；numba/numpy缺失时返回None（只探测一次）"""
+    global _numba_bincount
+    if _numba_bincount is None:
         try:
-            result = data.to_dict()
-            # SubGraph.to_dict()返回的是resultNodes和resultEdges格式
-            # 转换为标准格式
-            nodes = []
-            edges = []
-            if "resultNodes" in result:
-                for node in result["resultNodes"]:
-                    formatted_node = {
-                        "id": node.get("id", node.get("name", "")),
-                        "label": node.get("label", ""),
-                        "properties": node.get("properties", {})
-                    }
-                    if "name" in node:
-                        formatted_node["properties"]["name"] = node["name"]
-                    # 如果id为空，使用name作为id
-                    if not formatted_node["id"]:
-                        formatted_node["id"] = node.get("name", "")
-                    nodes.append(formatted_node)
-            elif "nodes" in result:
-                nodes = result["nodes"]
-            else:
-                # 尝试从对象属性获取
-                node_objs = getattr(data, "nodes", [])
-                for node in node_objs:
-                    if isinstance(node, dict):
-                        nodes.append(node)
-                    elif hasattr(node, "to_dict"):
-                        nodes.append(node.to_dict())
-                    else:
-                        nodes.append({
-                            "id": getattr(node, "id", ""),
-                            "label": getattr(node, "label", ""),
-                            "properties": getattr(node, "properties", {})
-                        })
-            
-            if "resultEdges" in result:
-                for edge in result["resultEdges"]:
-                    formatted_edge = {
-                        "from_id": edge.get("from", edge.get("from_id", "")),
-                        "from_type": edge.get("fromType", edge.get("from_type", "")),
-                        "label": edge.get("label", ""),
-                        "to_id": edge.get("to", edge.get("to_id", "")),
-                        "to_type": edge.get("toType", edge.get("to_type", "")),
-                        "properties": edge.get("properties", {})
-                    }
-                    edges.append(formatted_edge)
-            elif "edges" in result:
-                edges = result["edges"]
-            else:
-                # 尝试从对象属性获取
-                edge_objs = getattr(data, "edges", [])
-                for edge in edge_objs:
-                    if isinstance(edge, dict):
-                        edges.append(edge)
-                    elif hasattr(edge, "to_dict"):
-                        edges.append(edge.to_dict())
-                    else:
-                        edges.append({
-                            "from_id": getattr(edge, "from_id", ""),
-                            "from_type": getattr(edge, "from_type", ""),
-                            "label": getattr(edge, "label", ""),
-                            "to_id": getattr(edge, "to_id", ""),
-                            "to_type": getattr(edge, "to_type", ""),
-                            "properties": getattr(edge, "properties", {})
-                        })
-            
-            return {"nodes": nodes, "edges": edges}
-        except Exception as e:
-            print(f"      to_dict()失败: {e}")
-            return {
-                "nodes": getattr(data, "nodes", []),
-                "edges": getattr(data, "edges", [])
-            }
-    elif hasattr(data, "to_dict"):
-        # 如果有to_dict方法
+            import numpy as np
+            from numba import njit
+
+            @njit(cache=True)
+            def _bincount(arr, k):
+                out = np.zeros(k, dtype=np.int64)
+                for i in range(arr.shape[0]):
+                    out[arr[i]] += 1
+                return out
+
+            _numba_bincount = _bincount
+        except ImportError:
+            _numba_bincount = False
+    return _numba_bincount or None
+
+
+def _count_labels(items: list) -> Dict[str, int]:
+    """统计节点/边的标签分布，返回{label: count}
+
+    百万级且装有numba时把标签映射为int后走编译过的bincount循环，
+    十万级且装有pandas时走向量化value_counts，否则退回Counter，
+    各条路径的返回值完全一致。
+    """
+    n = len(items)
+    if n >= _NUMBA_MIN_ROWS:
+        bincount = _get_numba_bincount()
+        if bincount is not None:
+            import numpy as np
+
+            # 标签先编号成紧凑的int32数组，编译后的计数循环不碰Python对象
+            label_to_id: Dict[str, int] = {}
+            ids = np.fromiter(
+                (label_to_id.setdefault(_label(item), len(label_to_id))
+                 for item in items),
+                dtype=np.int32,
+                count=n,
+            )
+            counts = bincount(ids, len(label_to_id))
+            return {label: int(counts[i]) for label, i in label_to_id.items()}
+    if n >= _VECTORIZE_MIN_ROWS:
         try:
-            return data.to_dict()
-        except:
-            pass
-    elif hasattr(data, "__dict__"):
-        # 尝试从对象属性获取
-        attrs = data.__dict__
-        if "nodes" in attrs or "edges" in attrs:
-            return {
-                "nodes": getattr(data, "nodes", []),
-                "edges": getattr(data, "edges", [])
-            }
-        # 检查是否是BuilderComponentData包装
-        if "data" in attrs:
-            return parse_subgraph(attrs["data"])
-    
-    return {"nodes": [], "edges": []}
+            import pandas as pd
+        except ImportError:
+            pd = None
+        if pd is not None:
+            return pd.Series([_label(item) for item in items]).value_counts().to_dict()
+    return dict(Counter(_label(item) for item in items))
 
 
 def extract_entities_and_relations(ckpt_dir: Path) -> Dict[str, Any]:
     """从checkpoint目录中提取所有实体和关系"""
     all_entities = []
     all_relations = []
-    entity_types = defaultdict(int)
-    relation_types = defaultdict(int)
-    
+    # 同一节点/边会在主checkpoint与各子目录间重复出现，入列时按key
+    # 在线去重（O(1)集合判断），结果集不再随数据源数量成倍膨胀
+    seen_nodes = set()
+    seen_edges = set()
+    # 一次提取运行内的解析备忘录：同一value对象跨数据源重复出现时
+    # 直接复用上次的解析结果
+    parse_memo = {}
+
+    def add_node(node):
+        if isinstance(node, dict):
+            node_id = node.get("id", "")
+            key = (node.get("label", ""), node_id)
+        else:
+            node_id = getattr(node, "id", "")
+            key = (getattr(node, "label", ""), node_id)
+        if node_id:
+            if key in seen_nodes:
+                return
+            seen_nodes.add(key)
+        all_entities.append(node)
+
+    def add_edge(edge):
+        if isinstance(edge, dict):
+            key = (edge.get("from_id", ""), edge.get("label", ""),
+                   edge.get("to_id", ""), edge.get("from_type", ""))
+        else:
+            key = (getattr(edge, "from_id", ""), getattr(edge, "label", ""),
+                   getattr(edge, "to_id", ""), getattr(edge, "from_type", ""))
+        if key in seen_edges:
+            return
+        seen_edges.add(key)
+        all_relations.append(edge)
+
     # 1. 读取主checkpoint文件
     main_ckpt = ckpt_dir / "kag_checkpoint_0_1.ckpt"
     if main_ckpt.exists():
         print(f"\n读取主checkpoint文件: {main_ckpt}")
-        main_data = read_txt_checkpoint(main_ckpt)
-        print(f"  找到 {len(main_data)} 条记录")
-        
-        for key, value in main_data.items():
+        record_count = 0
+        for key, value in iter_txt_checkpoint(main_ckpt):
+            record_count += 1
             if isinstance(value, (dict, list)) or (SubGraph and isinstance(value, SubGraph)):
-                graph_data = parse_subgraph(value)
-                if "nodes" in graph_data:
-                    for node in graph_data["nodes"]:
-                        all_entities.append(node)
-                        if isinstance(node, dict):
-                            entity_types[node.get("label", "Unknown")] += 1
-                        elif hasattr(node, "label"):
-                            entity_types[node.label] += 1
-                if "edges" in graph_data:
-                    for edge in graph_data["edges"]:
-                        all_relations.append(edge)
-                        if isinstance(edge, dict):
-                            relation_types[edge.get("label", "Unknown")] += 1
-                        elif hasattr(edge, "label"):
-                            relation_types[edge.label] += 1
+                graph_data = parse_subgraph(value, memo=parse_memo)
+                for node in graph_data.get("nodes", []):
+                    add_node(node)
+                for edge in graph_data.get("edges", []):
+                    add_edge(edge)
+        print(f"  找到 {record_count} 条记录")
     
     # 2. 读取KAGPostProcessor的checkpoint（这里应该包含处理后的实体和关系）
     postprocessor_dir = ckpt_dir / "KAGPostProcessor"
@@ -312,45 +510,32 @@ def extract_entities_and_relations(ckpt_dir: Path) -> Dict[str, Any]:
         print(f"  找到 {len(cache_data)} 条记录")
         
         for key, value in cache_data.items():
-            graph_data = parse_subgraph(value)
+            graph_data = parse_subgraph(value, memo=parse_memo)
             nodes = graph_data.get("nodes", [])
             edges = graph_data.get("edges", [])
             if nodes or edges:
                 print(f"  处理key: {key[:50]}... -> nodes={len(nodes)}, edges={len(edges)}")
-            if nodes:
-                for node in nodes:
-                    all_entities.append(node)
-                    if isinstance(node, dict):
-                        entity_types[node.get("label", "Unknown")] += 1
-                    elif hasattr(node, "label"):
-                        entity_types[node.label] += 1
-            if edges:
-                for edge in edges:
-                    all_relations.append(edge)
-                    if isinstance(edge, dict):
-                        relation_types[edge.get("label", "Unknown")] += 1
-                    elif hasattr(edge, "label"):
-                        relation_types[edge.label] += 1
-        
-        # 读取.val文件
-        for val_file in postprocessor_dir.rglob("*.val"):
+            for node in nodes:
+                add_node(node)
+            for edge in edges:
+                add_edge(edge)
+
+        # 读取.val文件：pickle解码+parse_subgraph是纯Python的CPU密集操作，
+        # 多进程分片并行后在主进程合并，墙上时间≈最慢的一个分片
+        val_files = [str(p) for p in postprocessor_dir.rglob("*.val")]
+        if val_files:
+            from concurrent.futures import ProcessPoolExecutor
             try:
-                import pickle
-                with open(val_file, "rb") as f:
-                    val_data = pickle.load(f)
-                    graph_data = parse_subgraph(val_data)
-                    if "nodes" in graph_data:
-                        for node in graph_data["nodes"]:
-                            all_entities.append(node)
-                            if isinstance(node, dict):
-                                entity_types[node.get("label", "Unknown")] += 1
-                    if "edges" in graph_data:
-                        for edge in graph_data["edges"]:
-                            all_relations.append(edge)
-                            if isinstance(edge, dict):
-                                relation_types[edge.get("label", "Unknown")] += 1
+                with ProcessPoolExecutor() as executor:
+                    parsed_vals = list(executor.map(_load_and_parse, val_files))
             except Exception as e:
-                print(f"  读取 {val_file} 失败: {e}")
+                print(f"  并行读取.val失败，回退串行: {e}")
+                parsed_vals = [_load_and_parse(p) for p in val_files]
+            for nodes, edges in parsed_vals:
+                for node in nodes:
+                    add_node(node)
+                for edge in edges:
+                    add_edge(edge)
     
     # 3. 读取KnowledgeUnitSchemaFreeExtractor的checkpoint（这里包含原始提取的实体和关系）
     extractor_dir = ckpt_dir / "KnowledgeUnitSchemaFreeExtractor"
@@ -360,26 +545,21 @@ def extract_entities_and_relations(ckpt_dir: Path) -> Dict[str, Any]:
         print(f"  找到 {len(cache_data)} 条记录")
         
         for key, value in cache_data.items():
-            graph_data = parse_subgraph(value)
+            graph_data = parse_subgraph(value, memo=parse_memo)
             nodes = graph_data.get("nodes", [])
             edges = graph_data.get("edges", [])
             if nodes or edges:
                 print(f"  处理key: {key[:50]}... -> nodes={len(nodes)}, edges={len(edges)}")
-            if nodes:
-                for node in nodes:
-                    all_entities.append(node)
-                    if isinstance(node, dict):
-                        entity_types[node.get("label", "Unknown")] += 1
-                    elif hasattr(node, "label"):
-                        entity_types[node.label] += 1
-            if edges:
-                for edge in edges:
-                    all_relations.append(edge)
-                    if isinstance(edge, dict):
-                        relation_types[edge.get("label", "Unknown")] += 1
-                    elif hasattr(edge, "label"):
-                        relation_types[edge.label] += 1
-    
+            for node in nodes:
+                add_node(node)
+            for edge in edges:
+                add_edge(edge)
+
+    # 类型统计在去重后的结果上单趟完成；大数据量且装有pandas时用
+    # value_counts的向量化计数，否则Counter的C计数循环已经够快
+    entity_types = _count_labels(all_entities)
+    relation_types = _count_labels(all_relations)
+
     return {
         "entities": all_entities,
         "relations": all_relations,
@@ -388,53 +568,72 @@ def extract_entities_and_relations(ckpt_dir: Path) -> Dict[str, Any]:
     }
 
 
+# 运行时特化：首次见到某种输入类型时为它生成专用格式化函数并缓存，
+# 此后每条记录只剩一次dict查找+一次调用，不再重复isinstance分支
+_ENTITY_FIELDS = ("id", "label")
+_RELATION_FIELDS = ("from_id", "from_type", "label", "to_id", "to_type")
+_ENTITY_FORMATTERS = {}
+_RELATION_FORMATTERS = {}
+
+
+def _build_formatter(obj_type, fields):
+    """为一种输入类型编译专用的格式化函数（dict走下标，对象走getattr）"""
+    if issubclass(obj_type, dict):
+        items = ", ".join(f'"{f}": o.get("{f}", "")' for f in fields)
+        src = f'def _f(o):\n    return {{{items}, "properties": o.get("properties", {{}})}}\n'
+    else:
+        items = ", ".join(f'"{f}": getattr(o, "{f}", "")' for f in fields)
+        src = f'def _f(o):\n    return {{{items}, "properties": getattr(o, "properties", {{}})}}\n'
+    namespace = {}
+    exec(src, namespace)
+    return namespace["_f"]
+
+
+def _format_entity_fallback(entity: Any) -> Dict[str, Any]:
+    return {"id": str(entity), "label": "", "properties": {}}
+
+
+def _format_relation_fallback(relation: Any) -> Dict[str, Any]:
+    return {
+        "from_id": "",
+        "from_type": "",
+        "label": "",
+        "to_id": "",
+        "to_type": "",
+        "properties": {}
+    }
+
+
 def format_entity(entity: Any) -> Dict[str, Any]:
     """格式化实体数据"""
-    if isinstance(entity, dict):
-        return {
-            "id": entity.get("id", ""),
-            "label": entity.get("label", ""),
-            "properties": entity.get("properties", {})
-        }
-    elif hasattr(entity, "__dict__"):
-        return {
-            "id": getattr(entity, "id", ""),
-            "label": getattr(entity, "label", ""),
-            "properties": getattr(entity, "properties", {})
-        }
-    else:
-        return {"id": str(entity), "label": "", "properties": {}}
+    formatter = _ENTITY_FORMATTERS.get(type(entity))
+    if formatter is None:
+        if isinstance(entity, dict) or hasattr(entity, "__dict__"):
+            formatter = _build_formatter(type(entity), _ENTITY_FIELDS)
+        else:
+            formatter = _format_entity_fallback
+        _ENTITY_FORMATTERS[type(entity)] = formatter
+    return formatter(entity)
 
 
 def format_relation(relation: Any) -> Dict[str, Any]:
     """格式化关系数据"""
-    if isinstance(relation, dict):
-        return {
-            "from_id": relation.get("from_id", ""),
-            "from_type": relation.get("from_type", ""),
-            "label": relation.get("label", ""),
-            "to_id": relation.get("to_id", ""),
-            "to_type": relation.get("to_type", ""),
-            "properties": relation.get("properties", {})
-        }
-    elif hasattr(relation, "__dict__"):
-        return {
-            "from_id": getattr(relation, "from_id", ""),
-            "from_type": getattr(relation, "from_type", ""),
-            "label": getattr(relation, "label", ""),
-            "to_id": getattr(relation, "to_id", ""),
-            "to_type": getattr(relation, "to_type", ""),
-            "properties": getattr(relation, "properties", {})
-        }
-    else:
-        return {
-            "from_id": "",
-            "from_type": "",
-            "label": "",
-            "to_id": "",
-            "to_type": "",
-            "properties": {}
-        }
+    formatter = _RELATION_FORMATTERS.get(type(relation))
+    if formatter is None:
+        if isinstance(relation, dict) or hasattr(relation, "__dict__"):
+            formatter = _build_formatter(type(relation), _RELATION_FIELDS)
+        else:
+            formatter = _format_relation_fallback
+        _RELATION_FORMATTERS[type(relation)] = formatter
+    return formatter(relation)
+
+
+# 原生实现优先：view_ckpt_fast.pyx用`cythonize -i view_ckpt_fast.pyx`
+# 按需编译后这里自动换用编译版本，没有编译产物时沿用上面的纯Python实现
+try:
+    from view_ckpt_fast import format_entity, format_relation  # noqa: F811
+except ImportError:
+    pass
 
 
 def print_results(results: Dict[str, Any], limit: int = 50):
@@ -485,22 +684,31 @@ def print_results(results: Dict[str, Any], limit: int = 50):
 
 
 def save_to_json(results: Dict[str, Any], output_file: Path):
-    """保存结果到JSON文件"""
-    # 格式化数据以便JSON序列化
-    formatted_results = {
-        "summary": {
-            "total_entities": len(results['entities']),
-            "total_relations": len(results['relations']),
-            "entity_types": results['entity_types'],
-            "relation_types": results['relation_types']
-        },
-        "entities": [format_entity(e) for e in results['entities']],
-        "relations": [format_relation(r) for r in results['relations']]
+    """保存结果到JSON文件
+
+    逐条格式化并写出，而不是先物化两份完整的格式化列表再整体dump，
+    峰值内存只和单条记录有关；序列化走orjson（未安装时回退stdlib）。
+    """
+    summary = {
+        "total_entities": len(results['entities']),
+        "total_relations": len(results['relations']),
+        "entity_types": results['entity_types'],
+        "relation_types": results['relation_types']
     }
-    
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(formatted_results, f, ensure_ascii=False, indent=2)
-    
+
+    with open(output_file, "wb") as f:
+        f.write(b'{"summary": ' + _json_dumps(summary) + b', "entities": [')
+        for i, entity in enumerate(results['entities']):
+            if i:
+                f.write(b", ")
+            f.write(_json_dumps(format_entity(entity)))
+        f.write(b'], "relations": [')
+        for i, relation in enumerate(results['relations']):
+            if i:
+                f.write(b", ")
+            f.write(_json_dumps(format_relation(relation)))
+        f.write(b']}')
+
     print(f"\n结果已保存到: {output_file}")
 
 
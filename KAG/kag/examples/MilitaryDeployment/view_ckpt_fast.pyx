@@ -0,0 +1,57 @@
+# cython: language_level=3
+"""
+format_entity/format_relation的Cython实现
+
+按需编译：cythonize -i view_ckpt_fast.pyx
+编译产物存在时view_ckpt_data自动优先使用；没有编译产物时
+继续使用纯Python实现，行为完全一致。
+"""
+
+
+cpdef dict format_entity(object entity):
+    """格式化实体数据"""
+    if isinstance(entity, dict):
+        return {
+            "id": entity.get("id", ""),
+            "label": entity.get("label", ""),
+            "properties": entity.get("properties", {})
+        }
+    elif hasattr(entity, "__dict__"):
+        return {
+            "id": getattr(entity, "id", ""),
+            "label": getattr(entity, "label", ""),
+            "properties": getattr(entity, "properties", {})
+        }
+    else:
+        return {"id": str(entity), "label": "", "properties": {}}
+
+
+cpdef dict format_relation(object relation):
+    """格式化关系数据"""
+    if isinstance(relation, dict):
+        return {
+            "from_id": relation.get("from_id", ""),
+            "from_type": relation.get("from_type", ""),
+            "label": relation.get("label", ""),
+            "to_id": relation.get("to_id", ""),
+            "to_type": relation.get("to_type", ""),
+            "properties": relation.get("properties", {})
+        }
+    elif hasattr(relation, "__dict__"):
+        return {
+            "from_id": getattr(relation, "from_id", ""),
+            "from_type": getattr(relation, "from_type", ""),
+            "label": getattr(relation, "label", ""),
+            "to_id": getattr(relation, "to_id", ""),
+            "to_type": getattr(relation, "to_type", ""),
+            "properties": getattr(relation, "properties", {})
+        }
+    else:
+        return {
+            "from_id": "",
+            "from_type": "",
+            "label": "",
+            "to_id": "",
+            "to_type": "",
+            "properties": {}
+        }
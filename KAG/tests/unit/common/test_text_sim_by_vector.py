@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from kag.common.text_sim_by_vector import (
+    TextSimilarity,
+    batch_cosine_similarity,
+    cosine_similarity,
+)
+
+
+class _FakeVectorizer:
+    """返回固定ndarray向量的桩模型，覆盖本地embedding模型的返回类型"""
+
+    _vectors = {
+        "apple": np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32),
+        "apples": np.array([0.9, 0.1, 0.0, 0.0], dtype=np.float32),
+        "zebra": np.array([0.0, 1.0, 0.0, 0.0], dtype=np.float32),
+        "empty": np.array([], dtype=np.float32),
+    }
+
+    def vectorize(self, texts):
+        if isinstance(texts, str):
+            return self._vectors[texts]
+        return [self._vectors[text] for text in texts]
+
+
+def test_batch_cosine_similarity_matches_pairwise():
+    rng = np.random.default_rng(0)
+    query = rng.random(8).astype(np.float32)
+    matrix = rng.random((5, 8)).astype(np.float32)
+    batched = batch_cosine_similarity(query, matrix)
+    expected = [cosine_similarity(query, row) for row in matrix]
+    assert np.allclose(batched, expected)
+
+
+def test_batch_cosine_similarity_zero_norm_row_scores_zero():
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    matrix = np.array([[1.0, 0.0], [0.0, 0.0]], dtype=np.float32)
+    scores = batch_cosine_similarity(query, matrix)
+    assert np.isclose(scores[0], 1.0)
+    assert scores[1] == 0.0
+
+
+def test_batch_cosine_similarity_empty_matrix():
+    query = np.array([1.0, 0.0], dtype=np.float32)
+    matrix = np.zeros((0, 2), dtype=np.float32)
+    assert len(batch_cosine_similarity(query, matrix)) == 0
+
+
+def test_text_sim_result_with_ndarray_embeddings():
+    # 回归：vectorizer返回ndarray时不应触发多元素数组的真值判断
+    text_sim = TextSimilarity(_FakeVectorizer())
+    result = text_sim.text_sim_result(
+        "apple", ["apples", "zebra"], topk=2, low_score=0.5
+    )
+    assert [name for name, _ in result] == ["apples"]
+    assert result[0][1] >= 0.5
+
+
+def test_text_sim_result_skips_empty_ndarray_candidates():
+    text_sim = TextSimilarity(_FakeVectorizer())
+    result = text_sim.text_sim_result("apple", ["empty", "apples"], topk=2, low_score=0.5)
+    assert [name for name, _ in result] == ["apples"]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from kag.common.vectorize_model.openai_model import (
+    _BatchedEmbeddingMixin,
+    _EmbeddingCache,
+)
+
+
+def _make_packer(max_batch_size=64, max_tokens_per_request=8000):
+    obj = _BatchedEmbeddingMixin()
+    obj.max_batch_size = max_batch_size
+    obj.max_tokens_per_request = max_tokens_per_request
+    # 无tokenizer时_count_tokens退回len(text)*2的字符上界，测试结果可预测
+    obj._enc = None
+    return obj
+
+
+def test_pack_batches_single_batch_when_under_limits():
+    packer = _make_packer()
+    texts = ["a", "b", "c"]
+    assert list(packer._pack_batches(texts)) == [texts]
+
+
+def test_pack_batches_respects_max_batch_size():
+    packer = _make_packer(max_batch_size=2)
+    batches = list(packer._pack_batches(["a", "b", "c", "d", "e"]))
+    assert batches == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_pack_batches_respects_token_budget():
+    # 每条10字符 -> 上界20 token，预算50只够放2条
+    packer = _make_packer(max_tokens_per_request=50)
+    texts = ["x" * 10] * 5
+    batches = list(packer._pack_batches(texts))
+    assert [len(b) for b in batches] == [2, 2, 1]
+
+
+def test_pack_batches_oversize_text_yielded_alone():
+    packer = _make_packer(max_tokens_per_request=10)
+    batches = list(packer._pack_batches(["x" * 100, "y"]))
+    assert batches == [["x" * 100], ["y"]]
+
+
+def test_pack_batches_preserves_order_and_covers_all():
+    packer = _make_packer(max_batch_size=3, max_tokens_per_request=100)
+    texts = [f"text-{i}" for i in range(10)]
+    flattened = [t for batch in packer._pack_batches(texts) for t in batch]
+    assert flattened == texts
+
+
+def test_pack_batches_empty_input():
+    packer = _make_packer()
+    assert list(packer._pack_batches([])) == []
+
+
+def test_embedding_cache_miss_returns_none():
+    cache = _EmbeddingCache()
+    assert cache.get("missing") is None
+
+
+def test_embedding_cache_roundtrip():
+    cache = _EmbeddingCache()
+    cache.put("你好", [0.1, 0.2])
+    assert cache.get("你好") == [0.1, 0.2]
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = _EmbeddingCache(maxsize=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    # 访问a使其成为最近使用，放入c后应淘汰b
+    assert cache.get("a") == [1.0]
+    cache.put("c", [3.0])
+    assert cache.get("b") is None
+    assert cache.get("a") == [1.0]
+    assert cache.get("c") == [3.0]
@@ -1,19 +1,79 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
+
 from orchestrator import Orchestrator
 
 
 class APIRoutes:
     def __init__(self):
         self.orchestrator = Orchestrator()
-    
+        # 任务表：{task_id: {"state", "result", "event"}}
+        # CPython下dict单次读写是原子的，提交和查询都不需要加锁；
+        # 完成信号用Event通知，等待方阻塞在wait()上而不是轮询状态位
+        self.tasks: Dict[str, Dict] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=4, thread_name_prefix="api-task"
+        )
+
     def submit_task(self, task: str) -> Dict:
-        pass
-    
+        """提交任务到后台执行，立即返回task_id"""
+        task_id = uuid.uuid4().hex
+        entry = {
+            "state": "pending",
+            "result": None,
+            "event": threading.Event(),
+        }
+        self.tasks[task_id] = entry
+        self._executor.submit(self._run_task, task_id, task)
+        return {
+            "success": True,
+            "task_id": task_id,
+            "state": entry["state"],
+        }
+
     def get_task_status(self, task_id: str) -> Dict:
-        pass
-    
+        """O(1)查询任务状态，不阻塞"""
+        entry = self.tasks.get(task_id)
+        if entry is None:
+            return {"success": False, "error": f"未知任务: {task_id}"}
+        return {
+            "success": True,
+            "task_id": task_id,
+            "state": entry["state"],
+        }
+
     def get_task_result(self, task_id: str) -> Dict:
-        pass
-    
+        """阻塞等待任务完成并返回结果"""
+        entry = self.tasks.get(task_id)
+        if entry is None:
+            return {"success": False, "error": f"未知任务: {task_id}"}
+        entry["event"].wait()
+        return {
+            "success": entry["state"] == "done",
+            "task_id": task_id,
+            "state": entry["state"],
+            "result": entry["result"],
+        }
+
     def get_tools(self) -> Dict:
-        pass
+        """返回可用工具的schema列表"""
+        tools = self.orchestrator.work_agent.tools
+        return {
+            "success": True,
+            "tools": [tool.get_schema() for tool in tools.values()],
+        }
+
+    def _run_task(self, task_id: str, task: str):
+        """后台线程执行任务：先写result再置state，最后set事件唤醒等待方"""
+        entry = self.tasks[task_id]
+        entry["state"] = "running"
+        try:
+            entry["result"] = self.orchestrator.execute_task(task)
+            entry["state"] = "done"
+        except Exception as e:
+            entry["result"] = {"success": False, "error": str(e)}
+            entry["state"] = "failed"
+        finally:
+            entry["event"].set()
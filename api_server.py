@@ -1,15 +1,35 @@
-from fastapi import FastAPI, HTTPException, Body  # type: ignore
+from fastapi import FastAPI, HTTPException, Body, Request, Response  # type: ignore
 from fastapi.middleware.cors import CORSMiddleware  # type: ignore
-from fastapi.responses import JSONResponse, FileResponse  # type: ignore
-from pydantic import BaseModel, Field  # type: ignore
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse  # type: ignore
+from pydantic import BaseModel, ConfigDict, Field  # type: ignore
 from typing import Dict, Any, Optional, List
 import uvicorn  # type: ignore
+import asyncio
+
+# 装有aiofiles时结果文件走异步分块流式下载；没有则退回FileResponse
+try:
+    import aiofiles  # type: ignore
+except ImportError:
+    aiofiles = None
+
+# /api/kg的实体/关系列表这类dict密集的大payload，orjson的C编码器
+# 比stdlib json快数倍；未安装orjson时沿用默认JSONResponse
+try:
+    import orjson  # type: ignore # noqa: F401
+    from fastapi.responses import ORJSONResponse  # type: ignore
+    _DEFAULT_RESPONSE_CLASS = ORJSONResponse
+except ImportError:
+    _DEFAULT_RESPONSE_CLASS = JSONResponse
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import sys
+import hashlib
 import logging
 import os
 import time
+from datetime import datetime
+from email.utils import formatdate
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,7 +54,8 @@ except ImportError:
 app = FastAPI(
     title="空地智能体API服务",
     description="空地计算智能体系统的API接口",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=_DEFAULT_RESPONSE_CLASS
 )
 
 app.add_middleware(
@@ -45,6 +66,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request, exc):
+    """统一的500处理：记录完整堆栈，对外只回截断后的错误信息
+
+    各endpoint里不再重复try/except+traceback+截断的十几行样板，
+    handler代码对象更小，错误路径也少压几层栈帧。
+    """
+    logger.error(f"请求处理出错 {request.url.path}: {exc}", exc_info=True)
+    error_msg = str(exc)
+    if len(error_msg) > 500:
+        error_msg = error_msg[:500] + "..."
+    return JSONResponse(status_code=500, content={"detail": f"处理请求时出错: {error_msg}"})
+
+_KG_REFRESH_INTERVAL = 30.0
+
+# 同步的orchestrator调用（LLM往返+工具执行）直接写在async def里会卡住
+# uvicorn的事件循环，所有请求退化成串行；统一丢到线程池执行，
+# 循环只负责收发连接，单worker并发从1恢复到线程数
+@app.on_event("startup")
+async def _create_executor():
+    app.state.executor = ThreadPoolExecutor(
+        max_workers=int(os.getenv("WORK_THREADS", (os.cpu_count() or 4) * 2)),
+        thread_name_prefix="api-work",
+    )
+
+
+@app.on_event("startup")
+async def _start_kg_refresher():
+    """后台定期触发get_kg_data：checkpoint更新后的重建在后台完成
+
+    指纹没变时刷新近乎免费（一趟stat），变了则由刷新任务付掉
+    解析成本，轮询/api/kg*的请求始终只读现成缓存。
+    """
+    async def _refresh_loop():
+        while True:
+            await asyncio.sleep(_KG_REFRESH_INTERVAL)
+            try:
+                await _run_blocking(lambda: get_context_manager().get_kg_data())
+            except Exception as e:
+                logger.debug(f"KG后台刷新失败: {e}")
+
+    app.state.kg_refresh_task = asyncio.create_task(_refresh_loop())
+
+
+@app.on_event("shutdown")
+async def _shutdown_executor():
+    app.state.kg_refresh_task.cancel()
+    app.state.executor.shutdown(wait=False)
+
+
+async def _run_blocking(func):
+    """把阻塞调用提交到线程池，await期间事件循环继续处理其他请求"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.executor, func)
+
+
+@app.on_event("startup")
+async def _warm_singletons():
+    """启动时并行预构建Orchestrator和ContextManager
+
+    两个构造都要加载embedding模型等重资源，留到首个请求才做
+    会造成几十秒的尾延迟尖刺；gather让两者的初始化相互重叠。
+    设API_EAGER_INIT=0可关闭（如无模型权重的测试环境）。
+    """
+    if os.getenv("API_EAGER_INIT", "1") != "1":
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        loop.run_in_executor(app.state.executor, get_orchestrator),
+        loop.run_in_executor(app.state.executor, get_context_manager),
+    )
+    logger.info("Orchestrator与ContextManager预热完成")
+
+
 # 延迟初始化，避免启动时阻塞
 orchestrator = None
 context_manager = None
@@ -63,23 +159,30 @@ def get_context_manager():
         context_manager = ContextManager()
     return context_manager
 
+# extra='ignore'跳过对未声明字段的校验和报错构造，请求体可以宽松演进
 class TaskRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     task: str = Field(..., description="任务描述")
 
 class PlanRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     task: str = Field(..., description="任务描述")
 
 class ReplanRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     plan: Dict[str, Any] = Field(..., description="原计划")
     feedback: str = Field(..., description="用户反馈意见")
 
 class ExecuteRequest(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
     plan: Dict[str, Any] = Field(..., description="执行计划")
 
-class TaskResponse(BaseModel):
-    success: bool
-    result: Dict[str, Any]
-    message: Optional[str] = None
+# 响应不走Pydantic模型：出站的result是大段嵌套dict，再做一遍
+# 模型校验纯属空转，直接返回dict交给默认响应类编码
 
 
 @app.get("/")
@@ -118,7 +221,7 @@ async def root():
         "note": "完整的API文档、请求/响应示例和交互式测试，请访问 /docs (Swagger UI) 或 /redoc"
     }
 
-@app.post("/api/plan", response_model=TaskResponse, tags=["智能体任务"])
+@app.post("/api/plan", tags=["智能体任务"])
 async def generate_plan(request: PlanRequest):
     """
     生成执行计划
@@ -126,26 +229,16 @@ async def generate_plan(request: PlanRequest):
     根据用户任务描述，使用LLM和KAG知识图谱推理生成详细的执行计划。
     计划包含任务目标、执行步骤、工具参数等信息。
     """
-    try:
-        result = get_orchestrator().generate_plan(request.task)
-        return TaskResponse(
-            success=result.get("success", False),
-            result=result,
-            message="计划生成完成"
-        )
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        logger.error(f"生成计划错误: {str(e)}")
-        logger.error(error_detail)
-
-        error_msg = str(e)
-        if len(error_msg) > 500:
-            error_msg = error_msg[:500] + "..."
-
-        raise HTTPException(status_code=500, detail=f"生成计划时出错: {error_msg}")
+    # 连首次的Orchestrator构建一起放进线程池，不占事件循环；
+    # 异常统一交给unhandled_exception_handler记录并转500
+    result = await _run_blocking(lambda: get_orchestrator().generate_plan(request.task))
+    return {
+        "success": result.get("success", False),
+        "result": result,
+        "message": "计划生成完成"
+    }
 
-@app.post("/api/replan", response_model=TaskResponse, tags=["智能体任务"])
+@app.post("/api/replan", tags=["智能体任务"])
 async def replan_with_feedback(request: ReplanRequest):
     """
     根据反馈重新规划
@@ -153,40 +246,20 @@ async def replan_with_feedback(request: ReplanRequest):
     根据用户反馈或执行失败情况，重新生成执行计划。
     系统会分析反馈内容，调整计划步骤和参数。
     """
-    try:
-        import traceback
-        import logging
-        logger = logging.getLogger(__name__)
+    logger.info(f"收到重新规划请求，反馈: {request.feedback[:100]}")
 
-        logger.info(f"收到重新规划请求，反馈: {request.feedback[:100]}")
-
-        result = get_orchestrator().replan_with_feedback(request.plan, request.feedback)
-
-        logger.info("重新规划成功")
-        return TaskResponse(
-            success=result.get("success", False),
-            result=result,
-            message="重新规划完成"
-        )
-    except Exception as e:
-        import traceback
-        import logging
-        logger = logging.getLogger(__name__)
-
-        error_detail = traceback.format_exc()
-        logger.error(f"重新规划错误: {str(e)}")
-        logger.error(error_detail)
-
-        error_msg = str(e)
-        if len(error_msg) > 500:
-            error_msg = error_msg[:500] + "..."
+    result = await _run_blocking(
+        lambda: get_orchestrator().replan_with_feedback(request.plan, request.feedback)
+    )
 
-        raise HTTPException(
-            status_code=500,
-            detail=f"重新规划时出错: {error_msg}"
-        )
+    logger.info("重新规划成功")
+    return {
+        "success": result.get("success", False),
+        "result": result,
+        "message": "重新规划完成"
+    }
 
-@app.post("/api/execute", response_model=TaskResponse, tags=["智能体任务"])
+@app.post("/api/execute", tags=["智能体任务"])
 async def execute_plan(request: ExecuteRequest):
     """
     执行计划
@@ -194,26 +267,14 @@ async def execute_plan(request: ExecuteRequest):
     按照生成的计划执行所有步骤，调用相应的工具（如缓冲区筛选、高程筛选等），
     最终生成GeoJSON格式的结果文件。
     """
-    try:
-        result = get_orchestrator().execute_plan(request.plan)
-        return TaskResponse(
-            success=result.get("success", False),
-            result=result,
-            message="执行完成" if result.get("success") else "执行失败"
-        )
-    except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        logger.error(f"执行计划错误: {str(e)}")
-        logger.error(error_detail)
-
-        error_msg = str(e)
-        if len(error_msg) > 500:
-            error_msg = error_msg[:500] + "..."
-
-        raise HTTPException(status_code=500, detail=f"执行计划时出错: {error_msg}")
+    result = await _run_blocking(lambda: get_orchestrator().execute_plan(request.plan))
+    return {
+        "success": result.get("success", False),
+        "result": result,
+        "message": "执行完成" if result.get("success") else "执行失败"
+    }
 
-@app.post("/api/task", response_model=TaskResponse, tags=["智能体任务"])
+@app.post("/api/task", tags=["智能体任务"])
 async def submit_task(request: TaskRequest):
     """
     提交任务（完整流程）
@@ -221,15 +282,12 @@ async def submit_task(request: TaskRequest):
     一次性完成计划生成和执行，跳过审查步骤。
     适用于自动化场景或不需要人工审查的情况。
     """
-    try:
-        result = get_orchestrator().execute_task(request.task)
-        return TaskResponse(
-            success=result.get("success", False),
-            result=result,
-            message="任务执行完成" if result.get("success") else "任务执行失败"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"执行任务时出错: {str(e)}")
+    result = await _run_blocking(lambda: get_orchestrator().execute_task(request.task))
+    return {
+        "success": result.get("success", False),
+        "result": result,
+        "message": "任务执行完成" if result.get("success") else "任务执行失败"
+    }
 
 @app.get("/api/tools", tags=["工具与系统"])
 async def get_tools():
@@ -265,8 +323,10 @@ async def get_kg_info():
     数据来源：KAG checkpoint文件
     """
     try:
-        kg_data = get_context_manager().get_kg_data()
-        
+        # 命中指纹缓存时get_kg_data近乎免费，冷启动时要全量扫checkpoint，
+        # 同样放线程池里跑
+        kg_data = await _run_blocking(lambda: get_context_manager().get_kg_data())
+
         return {
             "success": True,
             "entity_count": kg_data.get("entity_count", 0),
@@ -278,6 +338,36 @@ async def get_kg_info():
         logger.error(f"获取知识图谱信息失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取知识图谱信息失败: {str(e)}")
 
+# 按type分桶的索引：随wrapper的kg缓存同生命周期，用对象身份判命中——
+# checkpoint没变时wrapper返回同一个dict对象，索引只在KG重载后重建一次
+_kg_type_index_cache = {"data": None, "entities": None, "relations": None}
+
+
+def _kg_type_index(kg_data: Dict) -> Dict:
+    """惰性构建并缓存{type: [记录]}索引，按类型查询从O(N)扫描降为O(1)取桶"""
+    cache = _kg_type_index_cache
+    if cache["data"] is kg_data:
+        return cache
+    by_entity_type = {}
+    for e in kg_data.get("entities", []):
+        by_entity_type.setdefault(e.get("type"), []).append(e)
+    by_relation_type = {}
+    for r in kg_data.get("relations", []):
+        by_relation_type.setdefault(r.get("type"), []).append(r)
+    cache["entities"] = by_entity_type
+    cache["relations"] = by_relation_type
+    cache["data"] = kg_data
+    return cache
+
+
+def _select_kg_by_type(kind: str, type_name: Optional[str], limit: int) -> List[Dict]:
+    """取指定类型（或全部）的前limit条实体/关系；在线程池里调用"""
+    kg_data = get_context_manager().get_kg_data()
+    if not type_name:
+        return kg_data.get(kind, [])[:limit]
+    return _kg_type_index(kg_data)[kind].get(type_name, [])[:limit]
+
+
 @app.get("/api/kg/entities", tags=["知识图谱"])
 async def get_kg_entities(entity_type: str = None, limit: int = 100):
     """
@@ -290,16 +380,10 @@ async def get_kg_entities(entity_type: str = None, limit: int = 100):
     返回指定类型或所有类型的实体列表。
     """
     try:
-        kg_data = get_context_manager().get_kg_data()
-        entities = kg_data.get("entities", [])
-        
-        # 如果指定了实体类型，进行过滤
-        if entity_type:
-            entities = [e for e in entities if e.get("type") == entity_type]
-        
-        # 限制返回数量
-        entities = entities[:limit]
-        
+        entities = await _run_blocking(
+            lambda: _select_kg_by_type("entities", entity_type, limit)
+        )
+
         return {
             "success": True,
             "count": len(entities),
@@ -321,16 +405,10 @@ async def get_kg_relations(relation_type: str = None, limit: int = 100):
     返回指定类型或所有类型的关系列表。
     """
     try:
-        kg_data = get_context_manager().get_kg_data()
-        relations = kg_data.get("relations", [])
-        
-        # 如果指定了关系类型，进行过滤
-        if relation_type:
-            relations = [r for r in relations if r.get("type") == relation_type]
-        
-        # 限制返回数量
-        relations = relations[:limit]
-        
+        relations = await _run_blocking(
+            lambda: _select_kg_by_type("relations", relation_type, limit)
+        )
+
         return {
             "success": True,
             "count": len(relations),
@@ -395,26 +473,32 @@ async def kag_query(request: Dict = Body(...)):
     }
     ```
     """
-    try:
-        question = request.get("question", "")
-        if not question:
-            raise HTTPException(status_code=400, detail="问题不能为空")
-        
-        context_manager = get_context_manager()
-        result = context_manager.query_with_kag_reasoning(question)
-        
-        return {
-            "success": True,
-            "answer": result.get("answer", ""),
-            "references": result.get("references", []),
-            "method": result.get("method", "kag_reasoning")
-        }
-    except Exception as e:
-        logger.error(f"KAG推理查询失败: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"KAG推理查询失败: {str(e)}")
+    question = request.get("question", "")
+    if not question:
+        raise HTTPException(status_code=400, detail="问题不能为空")
+
+    result = await _run_blocking(
+        lambda: get_context_manager().query_with_kag_reasoning(question)
+    )
+
+    return {
+        "success": True,
+        "answer": result.get("answer", ""),
+        "references": result.get("references", []),
+        "method": result.get("method", "kag_reasoning")
+    }
+
+# /api/results被前端轮询，每次全量glob+逐文件stat是纯系统调用开销；
+# 按目录mtime+短TTL缓存整份响应，命中时O(N)次stat降为1次
+_RESULTS_CACHE_TTL = 2.0
+_results_cache = {"key": None, "ts": 0.0, "payload": None, "etag": None}
+
+# 结果目录在进程生命周期内固定，resolve一次够用
+_RESULT_DIR_RESOLVED = PATHS["result_dir"].resolve()
+
 
 @app.get("/api/results", tags=["结果文件"])
-async def get_results_list():
+async def get_results_list(request: Request):
     """
     获取所有结果文件列表
     
@@ -434,30 +518,61 @@ async def get_results_list():
                 "count": 0
             }
 
-        result_files = list(result_dir.glob("*.geojson"))
-        result_files.sort(key=lambda x: x.stat().st_mtime, reverse=True)
-
-        results = []
-        for file_path in result_files:
-            stat = file_path.stat()
-            results.append({
-                "filename": file_path.name,
-                "size": stat.st_size,
-                "modified_time": stat.st_mtime,
-                "modified_time_str": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat.st_mtime))
-            })
-
-        return {
-            "success": True,
-            "results": results,
-            "count": len(results)
+        # 命中缓存时只付一次目录stat；目录mtime只反映增删文件，
+        # 覆盖写不改目录mtime，所以再叠加短TTL兜底
+        dir_mtime = result_dir.stat().st_mtime_ns
+        now = time.time()
+        if (_results_cache["key"] != dir_mtime
+                or now - _results_cache["ts"] >= _RESULTS_CACHE_TTL):
+            # 每个文件只stat一次，排序直接用已取到的mtime
+            entries = [(p, p.stat()) for p in result_dir.glob("*.geojson")]
+            entries.sort(key=lambda e: e[1].st_mtime, reverse=True)
+
+            # isoformat产出与strftime("%Y-%m-%d %H:%M:%S")相同的格式，
+            # 但直接按字段拼字符串，省掉每个文件一趟格式串解析
+            results = [
+                {
+                    "filename": p.name,
+                    "size": st.st_size,
+                    "modified_time": st.st_mtime,
+                    "modified_time_str": datetime.fromtimestamp(st.st_mtime).isoformat(
+                        sep=" ", timespec="seconds"
+                    )
+                }
+                for p, st in entries
+            ]
+
+            _results_cache["key"] = dir_mtime
+            _results_cache["ts"] = now
+            _results_cache["payload"] = {
+                "success": True,
+                "results": results,
+                "count": len(results)
+            }
+            # ETag要把每个文件的mtime/大小算进去：覆盖写不改目录mtime
+            # 也不改文件数，只看dir_mtime会永远304
+            _results_cache["etag"] = hashlib.md5(
+                "".join(
+                    f"{p.name}:{st.st_mtime_ns}:{st.st_size};" for p, st in entries
+                ).encode()
+            ).hexdigest()
+
+        # 轮询方带If-None-Match且内容未变时回304，整个JSON编码和
+        # 响应体传输都省掉
+        etag = _results_cache["etag"]
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(dir_mtime / 1_000_000_000, usegmt=True),
         }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return _DEFAULT_RESPONSE_CLASS(content=_results_cache["payload"], headers=headers)
     except Exception as e:
         logger.error(f"获取结果文件列表失败: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"获取结果文件列表失败: {str(e)}")
 
 @app.get("/api/results/{filename}", tags=["结果文件"])
-async def get_result_file(filename: str):
+async def get_result_file(filename: str, request: Request):
     """
     获取特定结果文件内容
     
@@ -469,22 +584,54 @@ async def get_result_file(filename: str):
     返回GeoJSON文件内容（Content-Type: application/geo+json）
     """
     try:
-        result_dir = PATHS["result_dir"]
-        file_path = result_dir / filename
-
-        if not file_path.resolve().is_relative_to(result_dir.resolve()):
+        # 防穿越只需确认文件名不含路径成分：basename不变即没有分隔符，
+        # 再排除"."和".."；目录本身用启动时缓存的resolve结果，
+        # 热路径不再为每个请求做resolve的readlink系统调用
+        if os.path.basename(filename) != filename or filename in (".", ".."):
             raise HTTPException(status_code=403, detail="访问被拒绝")
 
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail=f"文件 {filename} 不存在")
-
         if not filename.endswith('.geojson'):
             raise HTTPException(status_code=400, detail="只支持GeoJSON文件")
 
+        file_path = _RESULT_DIR_RESOLVED / filename
+
+        try:
+            st = file_path.stat()
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"文件 {filename} 不存在")
+
+        # nginx风格的mtime-size弱标识足以区分文件版本，不用读内容做哈希
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        cache_headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        }
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=cache_headers)
+
+        if aiofiles is not None:
+            # 64KB一块异步读发，单请求内存恒定，磁盘IO期间事件循环
+            # 可以继续处理其他请求
+            async def iter_file():
+                async with aiofiles.open(file_path, "rb") as f:
+                    while chunk := await f.read(64 * 1024):
+                        yield chunk
+
+            return StreamingResponse(
+                iter_file(),
+                media_type="application/geo+json",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{filename}"',
+                    "Content-Length": str(st.st_size),
+                    **cache_headers,
+                },
+            )
+
         return FileResponse(
             path=str(file_path),
             media_type="application/geo+json",
-            filename=filename
+            filename=filename,
+            headers=cache_headers
         )
     except HTTPException:
         raise
@@ -493,4 +640,14 @@ async def get_result_file(filename: str):
         raise HTTPException(status_code=500, detail=f"获取结果文件失败: {str(e)}")
 
 def run_api_server(port: int = 8000):
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
+    # loop/http保持auto：装有uvloop和httptools时uvicorn自动选用
+    # C实现的事件循环和HTTP解析器，缺失时静默退回stdlib实现；
+    # 多worker要求传导入字符串而不是app对象
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    uvicorn.run(
+        "api_server:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=port,
+        log_level="info",
+        workers=workers,
+    )
\ No newline at end of file
@@ -32,7 +32,6 @@ class ContextManager:
         prefixed_text = f"passage: {text}"
         return self.embedding_model.encode(prefixed_text).tolist()
 
-    
     def _init_kag_solver(self):
         """初始化KAG推理问答器（新版，基于KAG开发者模式）"""
         try: